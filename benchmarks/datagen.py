@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic data for benchmarks
+=============================
+
+Fills a database with workspaces, teams, users, budgets, categories and
+expense reports in every workflow state. Users, teams and workspaces are
+few and are made with the ORM; reports and expenses are inserted in
+batches without it, and spend rollups and settlement balances are rebuilt
+afterwards, just as ``manage.py rebuildrollups`` and ``rebuildbalances``
+do after a data load.
+
+Data is made from a seeded random generator, so the same arguments always
+make the same data, with dates relative to when it is made.
+"""
+
+import random
+from uuid import UUID
+from base64 import urlsafe_b64encode
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+from kharcha.models import (db, SEQ_GAP, REPORT_STATUS, User, Team, Workspace, Budget, Category, ExpenseReport,
+    Expense, SpendRollup, Balance)
+
+__all__ = ['generate']
+
+#: Share of reports in each state
+STATUS_WEIGHTS = [
+    (REPORT_STATUS.DRAFT, 15),
+    (REPORT_STATUS.PENDING, 15),
+    (REPORT_STATUS.REVIEW, 5),
+    (REPORT_STATUS.ACCEPTED, 20),
+    (REPORT_STATUS.REJECTED, 5),
+    (REPORT_STATUS.WITHDRAWN, 5),
+    (REPORT_STATUS.CLOSED, 35),
+    ]
+
+CATEGORIES = [u"Travel", u"Food", u"Lodging", u"Local conveyance", u"Internet", u"Phone", u"Stationery",
+    u"Equipment", u"Software", u"Books", u"Printing", u"Courier", u"Venue", u"Catering", u"Miscellaneous"]
+
+WORDS = [u"conference", u"client", u"visit", u"team", u"offsite", u"workshop", u"meetup", u"office",
+    u"supplies", u"hardware", u"event", u"training", u"review", u"launch", u"sprint", u"vendor"]
+
+#: Rows inserted per statement
+BATCH = 1000
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(table.insert(), rows[start:start + BATCH])
+
+
+def _buid(rng):
+    # Like coaster.utils.buid, but from the seeded generator
+    return urlsafe_b64encode(UUID(int=rng.getrandbits(128), version=4).bytes).decode('ascii').rstrip('=')
+
+
+def _phrase(rng, words=3):
+    return u' '.join(rng.choice(WORDS) for i in range(words)).capitalize()
+
+
+def _status(rng):
+    pick = rng.uniform(0, sum(weight for status, weight in STATUS_WEIGHTS))
+    for status, weight in STATUS_WEIGHTS:
+        pick -= weight
+        if pick <= 0:
+            return status
+    return STATUS_WEIGHTS[-1][0]
+
+
+def _make_workspace(rng, index, users):
+    """
+    Make a workspace with owner, reviewer and member teams drawn from
+    ``users``. The first user owns every workspace and the second reviews
+    them all, so benchmarks can act as either.
+    """
+    orgid = _buid(rng)
+    owner, reviewer = users[0], users[1]
+    others = rng.sample(users[2:], max(1, len(users[2:]) // 2))
+    owners = Team(userid=_buid(rng), orgid=orgid, title=u"Owners", owners=True)
+    owners.users = [owner]
+    reviewers = Team(userid=_buid(rng), orgid=orgid, title=u"Reviewers")
+    reviewers.users = [reviewer]
+    members = Team(userid=_buid(rng), orgid=orgid, title=u"Members")
+    members.users = [owner, reviewer] + others
+    db.session.add_all([owners, reviewers, members])
+    db.session.flush()
+    workspace = Workspace(name=u'org%d' % index, title=u"Organization %d" % index, userid=orgid,
+        currency=u'INR', timezone=u'Asia/Kolkata')
+    workspace.review_teams.append(reviewers)
+    workspace.access_teams.append(members)
+    db.session.add(workspace)
+    return workspace, [owner, reviewer] + others
+
+
+def _make_reports(rng, workspace, members, budgets, categories, reports, expenses, reviewer, since):
+    table = ExpenseReport.__table__
+    now = datetime.utcnow()
+    span = int((now - since).total_seconds())
+    rows = []
+    for url_id in range(1, reports + 1):
+        status = _status(rng)
+        title = _phrase(rng)
+        rows.append({
+            'created_at': now, 'updated_at': now,
+            'url_id': url_id,
+            'name': title.lower().replace(u' ', u'-'),
+            'title': title,
+            'workspace_id': workspace.id,
+            'user_id': rng.choice(members).id,
+            'datetime': since + timedelta(seconds=rng.randrange(span)),
+            'budget_id': rng.choice(budgets).id if rng.random() < 0.8 else None,
+            'currency': u'INR',
+            'description': u'',
+            'total_value': Decimal('0.00'),
+            'total_converted': Decimal('0.00'),
+            'reviewer_id': reviewer.id if status not in (REPORT_STATUS.DRAFT, REPORT_STATUS.PENDING) else None,
+            'notes': u'',
+            'status': status,
+            'last_seq': 0,
+            })
+    _insert(table, rows)
+    ids = dict(db.session.query(ExpenseReport.url_id, ExpenseReport.id).filter(
+        ExpenseReport.workspace_id == workspace.id))
+
+    expense_rows = []
+    totals = []
+    for row in rows:
+        report_id = ids[row['url_id']]
+        count = rng.randint(1, 2 * expenses - 1)
+        total = Decimal('0.00')
+        for seq in range(1, count + 1):
+            amount = Decimal(rng.randrange(100, 2500000)) / 100
+            total += amount
+            expense_rows.append({
+                'created_at': now, 'updated_at': now,
+                'report_id': report_id,
+                'seq': seq * SEQ_GAP,
+                'date': (row['datetime'] - timedelta(days=rng.randrange(30))).date(),
+                'category_id': rng.choice(categories).id,
+                'description': _phrase(rng, 4),
+                'amount': amount,
+                })
+        totals.append({'report_id': report_id, 'total': total, 'last_seq': count * SEQ_GAP})
+        if len(expense_rows) >= 10 * BATCH:
+            _insert(Expense.__table__, expense_rows)
+            expense_rows = []
+    _insert(Expense.__table__, expense_rows)
+    db.session.execute(table.update().where(table.c.id == db.bindparam('report_id')).values(
+        total_value=db.bindparam('total'), total_converted=db.bindparam('total'),
+        last_seq=db.bindparam('last_seq')), totals)
+
+
+def generate(workspaces=2, users=50, budgets=10, reports=10000, expenses=5, days=730, seed=0):
+    """
+    Fill the database with ``reports`` expense reports in each of
+    ``workspaces`` workspaces, with ``expenses`` expenses in each on
+    average, dated over the last ``days`` days.
+    """
+    rng = random.Random(seed)
+    people = [User(userid=_buid(rng), username=u'user%d' % index, fullname=u"User %d" % index,
+        email=u'user%d@example.com' % index) for index in range(max(users, 3))]
+    db.session.add_all(people)
+    db.session.flush()
+    since = datetime.utcnow() - timedelta(days=days)
+
+    for index in range(1, workspaces + 1):
+        workspace, members = _make_workspace(rng, index, people)
+        workspace_budgets = [Budget(workspace=workspace, name=u'budget%d' % number,
+            title=u"Budget %d" % number) for number in range(1, budgets + 1)]
+        workspace_categories = [Category(workspace=workspace, name=u'category%d' % number, title=title)
+            for number, title in enumerate(CATEGORIES, 1)]
+        db.session.add_all(workspace_budgets + workspace_categories)
+        db.session.flush()
+        _make_reports(rng, workspace, members, workspace_budgets, workspace_categories, reports, expenses,
+            people[1], since)
+        db.session.commit()
+
+    SpendRollup.rebuild()
+    Balance.rebuild()
+    db.session.commit()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for kharcha's busiest pages and actions
+==================================================
+
+Times report listings, report pages, budgets, CSV export, adding and
+deleting expenses and workflow transitions through Flask's test client,
+recording how long each request took and how many SQL statements it ran.
+Run from the repository root::
+
+    python -m benchmarks.run --database sqlite:////tmp/kharcha-bench.db
+    python -m benchmarks.run --database postgresql://localhost/kharcha_bench
+
+The database is filled with synthetic data (see :mod:`benchmarks.datagen`)
+if it has no workspaces, or when ``--reset`` is given, which drops all
+tables first. Never point this at a database you care about: actions
+change data.
+
+Requests are made as users picked from the data. Lastuser is bypassed by
+setting ``g.user`` after its own ``before_request`` handler has run.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import argparse
+from collections import OrderedDict
+from timeit import default_timer
+
+os.environ.setdefault('ENVIRONMENT', 'testing')
+
+from flask import g
+from coaster.auth import add_auth_attribute
+
+from kharcha import app
+from kharcha.models import db, REPORT_STATUS, User, Workspace, ExpenseReport, Expense, Category
+
+#: Expense rows added per request by the batch add benchmark
+ADD_ROWS = 10
+
+_acting = {'user_id': None}
+_queries = [0]
+
+
+def act_as(user_id):
+    _acting['user_id'] = user_id
+
+
+def _login():
+    if _acting['user_id'] is not None:
+        g.user = User.query.get(_acting['user_id'])
+        add_auth_attribute('user', g.user)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _queries[0] += 1
+
+
+def configure(database):
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Query counts are measured here, not enforced
+    app.config['SQL_QUERY_BUDGET'] = None
+    # Runs after lastuser's handler, which was registered first
+    app.before_request(_login)
+    with app.app_context():
+        db.event.listen(db.engine, 'before_cursor_execute', _count_query)
+
+
+def prepare(reset, **sizes):
+    from benchmarks.datagen import generate
+    with app.app_context():
+        if reset:
+            db.drop_all()
+        db.create_all()
+        if Workspace.query.first() is None:
+            print("Generating data...")
+            started = default_timer()
+            generate(**sizes)
+            print("Generated in %.1fs" % (default_timer() - started))
+        print("%s: %d workspaces, %d reports, %d expenses" % (db.engine.dialect.name,
+            Workspace.query.count(), ExpenseReport.query.count(), Expense.query.count()))
+        db.session.remove()
+
+
+class Fixtures(object):
+    """
+    Names of the workspace, users and reports that benchmarks act on, read
+    once so that no ORM objects are held between requests.
+    """
+    def __init__(self, repeat):
+        with app.app_context():
+            workspace = Workspace.query.order_by(Workspace.id).first()
+            self.workspace = workspace.name
+            self.reviewer_id = workspace.review_teams[0].users[0].id
+            # The report with the most expenses, and its owner
+            report = ExpenseReport.query.filter(ExpenseReport.workspace == workspace,
+                ExpenseReport.status == REPORT_STATUS.CLOSED).order_by(ExpenseReport.last_seq.desc()).first()
+            self.report = report.url_name
+            self.owner_id = report.user_id
+            self.budget = report.budget.name if report.budget else workspace.budgets[0].name
+            self.category = Category.query.filter_by(workspace=workspace).first().name
+            # Drafts to add expenses to and to move through the workflow,
+            # one per repeat so every run starts from the same state
+            drafts = ExpenseReport.query.filter(ExpenseReport.workspace == workspace,
+                ExpenseReport.status == REPORT_STATUS.DRAFT,
+                ExpenseReport.user_id != self.reviewer_id).order_by(ExpenseReport.id).limit(repeat).all()
+            if len(drafts) < repeat:
+                raise SystemExit("Need %d draft reports, found %d" % (repeat, len(drafts)))
+            self.drafts = [(draft.url_name, draft.user_id) for draft in drafts]
+            db.session.remove()
+
+    def last_expense(self, report):
+        with app.app_context():
+            expense_id = db.session.query(Expense.id).join(ExpenseReport).filter(
+                ExpenseReport.workspace.has(name=self.workspace),
+                ExpenseReport.url_id == int(report.split('-')[0])).order_by(Expense.seq.desc()).limit(1).scalar()
+            db.session.remove()
+            return expense_id
+
+
+class Runner(object):
+    def __init__(self, client):
+        self.client = client
+        scheme = app.config.get('PREFERRED_URL_SCHEME') or 'http'
+        self.base_url = '%s://%s/' % (scheme, app.config.get('SERVER_NAME') or 'localhost')
+        self.results = OrderedDict()
+
+    def request(self, name, user_id, method, path, expect=(200,), **kwargs):
+        act_as(user_id)
+        _queries[0] = 0
+        started = default_timer()
+        response = self.client.open(path, method=method, base_url=self.base_url, **kwargs)
+        response.get_data()
+        elapsed = default_timer() - started
+        if response.status_code not in expect:
+            raise SystemExit("%s: %s %s returned %s" % (name, method, path, response.status))
+        if name is not None:
+            self.results.setdefault(name, []).append((elapsed, _queries[0]))
+        return response
+
+
+def run(runner, fixtures, repeat, warmup):
+    ws = '/' + fixtures.workspace
+    report = '%s/reports/%s' % (ws, fixtures.report)
+    reads = [
+        ('reports_all', fixtures.reviewer_id, ws + '/reports/all'),
+        ('report', fixtures.owner_id, report),
+        ('budget', fixtures.owner_id, '%s/budgets/%s' % (ws, fixtures.budget)),
+        ('report_csv', fixtures.owner_id, report + '/csv'),
+        ]
+    for index in range(warmup + repeat):
+        timed = index >= warmup
+        for name, user_id, path in reads:
+            runner.request(name if timed else None, user_id, 'GET', path)
+
+    rows = [{'date': '2019-01-%02d' % (day + 1), 'category': fixtures.category,
+        'description': u"Benchmark expense %d" % day, 'amount': '%d.50' % (day * 100 + 99)}
+        for day in range(ADD_ROWS)]
+    for url_name, user_id in fixtures.drafts:
+        draft = '%s/reports/%s' % (ws, url_name)
+        runner.request('expense_add', user_id, 'POST', draft + '/expenses', data=json.dumps({'expenses': rows}),
+            content_type='application/json')
+        expense_id = fixtures.last_expense(url_name)
+        runner.request('expense_delete', user_id, 'POST', '%s/%d/delete' % (draft, expense_id),
+            expect=(303,), data={'delete': 'Delete'})
+        for transition, actor in [('submit', user_id), ('return_for_review', fixtures.reviewer_id),
+                ('resubmit', user_id), ('accept', fixtures.reviewer_id), ('close', fixtures.reviewer_id)]:
+            runner.request(transition, actor, 'POST', '%s/%s' % (draft, transition), expect=(303,))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summary(results):
+    table = []
+    for name, samples in results.items():
+        times = [elapsed * 1000 for elapsed, queries in samples]
+        queries = [queries for elapsed, queries in samples]
+        table.append({
+            'name': name,
+            'count': len(samples),
+            'median_ms': percentile(times, 0.5),
+            'p95_ms': percentile(times, 0.95),
+            'max_ms': max(times),
+            'queries': percentile(queries, 0.5),
+            'max_queries': max(queries),
+            })
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark kharcha's busiest pages and actions")
+    parser.add_argument('--database', default='sqlite:////tmp/kharcha-bench.db',
+        help="SQLAlchemy database URI (default: %(default)s)")
+    parser.add_argument('--reset', action='store_true', help="Drop all tables and generate new data")
+    parser.add_argument('--workspaces', type=int, default=2)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--reports', type=int, default=10000, help="Reports per workspace")
+    parser.add_argument('--expenses', type=int, default=5, help="Average expenses per report")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20, help="Timed requests per benchmark")
+    parser.add_argument('--warmup', type=int, default=2, help="Untimed requests before timing reads")
+    parser.add_argument('--json', metavar='FILE', help="Also write results to FILE as JSON")
+    args = parser.parse_args(argv)
+
+    configure(args.database)
+    prepare(args.reset, workspaces=args.workspaces, users=args.users, reports=args.reports,
+        expenses=args.expenses, seed=args.seed)
+    runner = Runner(app.test_client())
+    run(runner, Fixtures(args.repeat), args.repeat, args.warmup)
+
+    table = summary(runner.results)
+    print("%-18s %6s %10s %10s %10s %8s %8s" % ('benchmark', 'runs', 'median ms', 'p95 ms', 'max ms',
+        'queries', 'max q'))
+    for row in table:
+        print("%(name)-18s %(count)6d %(median_ms)10.1f %(p95_ms)10.1f %(max_ms)10.1f %(queries)8d "
+            "%(max_queries)8d" % row)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'database': args.database.split(':')[0], 'results': table}, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Startup time benchmark
+======================
+
+Measures, in fresh processes, how long it takes to import the app and to
+load every template, first compiling templates from source and then
+loading them from the bytecode cache (see :mod:`kharcha.templating`). Run
+from the repository root::
+
+    python -m benchmarks.startup --runs 10
+
+For a breakdown of import time by module, use ``python -X importtime -c
+'import kharcha'``.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+CHILD = '''
+import sys, json
+from timeit import default_timer
+started = default_timer()
+from kharcha import app
+imported = default_timer() - started
+from kharcha.templating import prewarm_templates
+if sys.argv[1] == 'compile':
+    app.jinja_env.bytecode_cache = None
+# In case PREWARM_TEMPLATES already loaded them
+app.jinja_env.cache.clear()
+started = default_timer()
+count = prewarm_templates(app)
+print(json.dumps({'import': imported, 'templates': default_timer() - started, 'count': count}))
+'''
+
+
+def measure(mode):
+    output = subprocess.check_output([sys.executable, '-c', CHILD, mode])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure app import and template loading time")
+    parser.add_argument('--runs', type=int, default=5, help="Processes started for each mode")
+    args = parser.parse_args(argv)
+    os.environ.setdefault('ENVIRONMENT', 'testing')
+
+    # Fill the bytecode cache
+    measure('bytecode')
+    print("%-10s %10s %14s %10s" % ('mode', 'import ms', 'templates ms', 'templates'))
+    for mode in ('compile', 'bytecode'):
+        results = [measure(mode) for run in range(args.runs)]
+        print("%-10s %10.1f %14.1f %10d" % (mode, median([r['import'] for r in results]) * 1000,
+            median([r['templates'] for r in results]) * 1000, results[0]['count']))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
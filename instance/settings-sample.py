@@ -31,3 +31,70 @@ DEFAULT_MAIL_SENDER = ('HasGeek', 'test@example.com')
 ADMINS = []
 #: Log file
 LOGFILE = 'error.log'
+#: Number of reports shown per workflow state before "Load more"
+REPORTS_PAGE_SIZE = 50
+#: Rows fetched per database round trip when streaming CSV exports
+CSV_BATCH_SIZE = 1000
+#: Seconds to keep sidebar budgets, categories and workspaces in the cache.
+#: Entries are also invalidated whenever one of these changes
+SIDEBAR_CACHE_TIMEOUT = 86400
+#: Currency that exchange rates are quoted against. Load rates with
+#: "python manage.py loadrates rates.csv", then update reports with
+#: "python manage.py convertreports"
+EXCHANGE_RATE_BASE = 'USD'
+#: Folder for uploaded receipts, stored by content hash. Defaults to
+#: uploads/ in the instance folder
+UPLOAD_FOLDER = None
+#: Largest upload accepted, in bytes. Larger uploads are spooled to a
+#: temporary file while the request is parsed, not held in memory
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+#: Seconds after which a receipt thumbnail job claimed by a worker that
+#: stopped responding is run again, and the number of attempts before a
+#: failing job is given up. PDF previews need poppler's pdftoppm
+JOB_TIMEOUT = 600
+JOB_ATTEMPTS = 5
+#: Let the front-end server send receipt files instead of the app. For
+#: nginx, set X_ACCEL_REDIRECT_PREFIX to an internal location that aliases
+#: UPLOAD_FOLDER, such as '/_receipts/' with:
+#:   location /_receipts/ { internal; alias /path/to/uploads/; }
+#: For Apache (mod_xsendfile) or lighttpd, set USE_X_SENDFILE = True
+X_ACCEL_REDIRECT_PREFIX = None
+USE_X_SENDFILE = False
+#: Seconds browsers may cache receipts and their thumbnails
+RECEIPT_CACHE_TIMEOUT = 86400
+#: Reports per page of search results
+SEARCH_PAGE_SIZE = 20
+#: Most expenses accepted in one batch by the bulk entry endpoint
+EXPENSE_BATCH_SIZE = 500
+#: Host name used in links in notification mails, which are sent by
+#: "python manage.py sendnotifications". To see mails without delivering
+#: them, run "python -m aiosmtpd -n -l localhost:1025" and set MAIL_PORT
+#: to 1025
+SERVER_NAME = None
+PREFERRED_URL_SCHEME = 'https'
+MAIL_PORT = 25
+#: Send SQL statement counts and timings in a Server-Timing header
+#: (defaults to on in debug and testing mode only)
+# SERVER_TIMING = True
+#: Warn when a request runs the same SQL statement this many times
+SQL_REPEAT_THRESHOLD = 5
+#: Warn when a request runs more SQL statements than this, and fail the
+#: request in testing mode. None for no limit
+SQL_QUERY_BUDGET = None
+#: Lastuser userids of users who may profile requests. Profiling is off,
+#: with no overhead, when this is empty. Make a token with "python manage.py
+#: profiletoken <userid>" and send it in an X-Profile-Token header or a
+#: _profile query parameter
+PROFILE_ADMINS = []
+#: Folder for saved profiles (default: instance/profiles)
+PROFILE_FOLDER = None
+#: Seconds between stack samples while profiling
+PROFILE_INTERVAL = 0.005
+#: Seconds for which a profiling token is valid
+PROFILE_TOKEN_MAX_AGE = 86400
+#: Folder for compiled templates (default: instance/template-cache). False
+#: to compile templates in every process
+TEMPLATE_CACHE_FOLDER = None
+#: Compile all templates when the app is loaded, so that workers forked
+#: from a preloaded app start with them ready
+PREWARM_TEMPLATES = False
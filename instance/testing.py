@@ -1,4 +1,5 @@
 SECRET_KEY = 'testkey'
+TESTING = True
 SQLALCHEMY_DATABASE_URI = 'postgres://127.0.0.1/kharcha_testing'
 SERVER_NAME = 'kharcha.travis.dev:3000'
 STATIC_SUBDOMAIN = 'static'
@@ -7,4 +8,6 @@ LASTUSER_CLIENT_ID = ''
 LASTUSER_CLIENT_SECRET = ''
 
 UPLOAD_FOLDER = '/tmp'
-TIMEZONE = 'Asia/Calcutta'
\ No newline at end of file
+TIMEZONE = 'Asia/Calcutta'
+SQL_QUERY_BUDGET = 50
+CACHE_TYPE = 'simple'
@@ -15,7 +15,7 @@ version = Version(__version__)
 app = Flask(__name__, instance_relative_config=True)
 lastuser = Lastuser()
 
-from . import models, views
+from . import models, views, instrumentation, profiling, templating
 from .models import db
 
 assets['kharcha.css'][version] = 'css/app.css'
@@ -23,8 +23,13 @@ assets['kharcha.css'][version] = 'css/app.css'
 
 # Configure the app
 coaster.app.init_app(app)
+# First, so that queries made by other before_request handlers are counted
+instrumentation.init_app(app)
 migrate = Migrate(app, models.db)
 baseframe.init_app(app, requires=['baseframe', 'jquery.expander', 'kharcha'])
 lastuser.init_app(app)
 lastuser.init_usermanager(UserManager(models.db, models.User, models.Team))
+profiling.init_app(app)
 app.config['tz'] = timezone(app.config['TIMEZONE'])
+# Last, as compiling templates needs all filters and blueprints registered
+templating.init_app(app)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+Thumbnails and previews of receipts
+===================================
+
+Receipts are resized by a pool of worker processes started with
+``manage.py receiptworker``, never while handling a request. Uploads queue
+a :class:`~kharcha.models.DerivativeJob` for each new stored file. The
+worker's main process claims jobs from the database and the pool makes the
+images; only the main process talks to the database.
+
+Making derivatives is idempotent: images are written to temporary files
+and renamed into place, and images that already exist are not made again.
+Jobs claimed by a worker that died are reclaimed after ``JOB_TIMEOUT``
+seconds. They count as failed, since the file may be what killed the
+worker, and failed jobs are retried with exponential backoff up to
+``JOB_ATTEMPTS`` times.
+"""
+
+import os
+import time
+import subprocess
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from tempfile import NamedTemporaryFile
+from PIL import Image, ImageOps
+
+from kharcha import app
+from kharcha.models import db, JOB_STATUS, DerivativeJob
+from kharcha.storage import DERIVATIVES, upload_folder, stored_path, move_into_place
+
+__all__ = ['make_derivatives', 'claim_jobs', 'run_worker']
+
+#: Largest dimensions of each kind of derivative
+SIZES = {
+    'thumbnail': (200, 200),
+    'preview': (1200, 1200),
+    }
+
+
+def _tempfile(suffix='.jpg'):
+    return NamedTemporaryFile(dir=os.path.join(upload_folder(), 'tmp'), suffix=suffix, delete=False)
+
+
+def _save_resized(image, kind, hash):
+    image = image.copy()
+    image.thumbnail(SIZES[kind], Image.LANCZOS)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    with _tempfile() as tmp:
+        try:
+            image.save(tmp, 'JPEG', quality=85)
+            # On disk before it is renamed into place, so that a crash can't
+            # leave a truncated image at the final path
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except Exception:
+            os.remove(tmp.name)
+            raise
+    move_into_place(tmp.name, stored_path(hash, DERIVATIVES[kind]))
+
+
+def _pdf_first_page(path):
+    """
+    Render the first page of a PDF to a temporary JPEG with poppler's
+    pdftoppm and return its name.
+    """
+    with _tempfile('') as tmp:
+        pass
+    try:
+        subprocess.check_call(['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-jpeg',
+            '-scale-to', str(max(SIZES['preview'])), path, tmp.name])
+    finally:
+        os.remove(tmp.name)
+    return tmp.name + '.jpg'
+
+
+def make_derivatives(hash, mimetype):
+    """
+    Make the thumbnail and preview of a stored file, if its type is
+    supported and they don't already exist. Returns a dict of which
+    derivatives are available.
+    """
+    paths = dict((kind, stored_path(hash, suffix)) for kind, suffix in DERIVATIVES.items())
+    missing = [kind for kind, path in paths.items() if not os.path.exists(path)]
+    if missing:
+        source = stored_path(hash)
+        rendered = None
+        if mimetype == 'application/pdf':
+            source = rendered = _pdf_first_page(source)
+        elif not mimetype.startswith('image/'):
+            return dict((kind, False) for kind in DERIVATIVES)
+        try:
+            # Phone cameras record rotation in EXIF instead of rotating the image
+            image = ImageOps.exif_transpose(Image.open(source))
+            for kind in missing:
+                _save_resized(image, kind, hash)
+        finally:
+            if rendered:
+                os.remove(rendered)
+    return dict((kind, True) for kind in DERIVATIVES)
+
+
+def _run_job(job):
+    # Runs in a pool process. Errors are returned rather than raised so that
+    # one bad file can't stop the others in its batch
+    job_id, hash, mimetype = job
+    try:
+        return job_id, make_derivatives(hash, mimetype), None
+    except Exception as e:
+        return job_id, None, '%s: %s' % (e.__class__.__name__, e)
+
+
+def _failed(job, error):
+    job.attempts += 1
+    job.error = error
+    if job.attempts >= app.config.get('JOB_ATTEMPTS', 5):
+        job.status = JOB_STATUS.FAILED
+    else:
+        job.status = JOB_STATUS.PENDING
+        job.run_after = datetime.utcnow() + timedelta(minutes=2 ** job.attempts)
+
+
+def claim_jobs(limit):
+    """
+    Claim up to ``limit`` jobs that are due, first reclaiming jobs whose
+    worker has stopped. A reclaimed job counts as a failed attempt, since
+    the file may be what stopped the worker. On PostgreSQL, rows locked by
+    other workers are skipped; elsewhere, the conditional update ensures a
+    job goes to only one worker.
+    """
+    now = datetime.utcnow()
+    timeout = app.config.get('JOB_TIMEOUT', 600)
+    for job in DerivativeJob.query.filter(DerivativeJob.status == JOB_STATUS.RUNNING,
+            DerivativeJob.claimed_at < now - timedelta(seconds=timeout)).with_for_update(skip_locked=True):
+        _failed(job, "Not done within %d seconds" % timeout)
+    ids = [job_id for job_id, in db.session.query(DerivativeJob.id).filter(
+        DerivativeJob.status == JOB_STATUS.PENDING, DerivativeJob.run_after <= now).order_by(
+        DerivativeJob.run_after).limit(limit).with_for_update(skip_locked=True)]
+    if ids:
+        DerivativeJob.query.filter(DerivativeJob.id.in_(ids), DerivativeJob.status == JOB_STATUS.PENDING).update(
+            {'status': JOB_STATUS.RUNNING, 'claimed_at': now}, synchronize_session=False)
+    db.session.commit()
+    if not ids:
+        return []
+    return DerivativeJob.query.filter(DerivativeJob.id.in_(ids), DerivativeJob.claimed_at == now).options(
+        db.joinedload(DerivativeJob.file)).all()
+
+
+def _record(job, available, error):
+    if error is None:
+        job.file.thumbnail = available['thumbnail']
+        job.file.preview = available['preview']
+        job.status = JOB_STATUS.DONE
+        job.error = None
+    else:
+        _failed(job, error)
+
+
+def run_worker(processes=2, batch=20, poll=5, once=False):
+    """
+    Run jobs until interrupted, or until none are left if ``once`` is set.
+    """
+    # Start the pool before using the database, so that no connections are
+    # shared with the pool processes
+    pool = Pool(processes)
+    try:
+        while True:
+            jobs = claim_jobs(batch)
+            if not jobs:
+                if once:
+                    break
+                time.sleep(poll)
+                continue
+            byid = dict((job.id, job) for job in jobs)
+            for job_id, available, error in pool.imap_unordered(_run_job,
+                    [(job.id, job.file.hash, job.file.mimetype) for job in jobs]):
+                _record(byid[job_id], available, error)
+                if error:
+                    app.logger.warning("Derivative job %d failed: %s", job_id, error)
+            db.session.commit()
+    finally:
+        pool.terminate()
+        pool.join()
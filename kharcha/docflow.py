@@ -84,7 +84,9 @@ class DocumentWorkflow(docflow.DocumentWorkflow):
         Permissions for this workflow. Plays nice with
         :meth:`coaster.views.load_models` and
         :class:`coaster.sqlalchemy.PermissionMixin` to determine the available
-        permissions to the current user.
+        permissions to the current user. The document's own permissions are
+        memoized for the request (see :mod:`kharcha.permissions`), so checking
+        each available transition does not re-evaluate them.
         """
         perms = set(super(DocumentWorkflow, self).permissions())
         if g:
@@ -2,3 +2,4 @@
 
 from kharcha.forms.expenses import *
 from kharcha.forms.workspace import *
+from kharcha.forms.settlements import *
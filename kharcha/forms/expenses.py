@@ -7,9 +7,10 @@ import wtforms
 from wtforms.ext.sqlalchemy.fields import QuerySelectField
 from baseframe.forms import Form, RichTextField
 from coaster.utils import simplify_text
-from kharcha.models import Category, Budget, Expense
+from kharcha.models import Category, Budget, ExpenseReport, Expense, REPORT_STATUS
 
-__all__ = ['BudgetForm', 'CategoryForm', 'ExpenseReportForm', 'ExpenseForm', 'WorkflowForm', 'ReviewForm']
+__all__ = ['BudgetForm', 'CategoryForm', 'ExpenseReportForm', 'ExpenseForm', 'WorkflowForm', 'ReviewForm',
+    'ReceiptForm']
 
 CURRENCIES = [
     ("INR", "INR - India, Rupees"),
@@ -299,3 +300,33 @@ class ReviewForm(Form):
     Reviewer notes on expense reports.
     """
     notes = RichTextField("Notes", validators=[wtforms.validators.Required()])
+
+
+def editable_reports():
+    return ExpenseReport.query.filter_by(workspace=g.workspace, user=g.user).filter(
+        ExpenseReport.status.in_([REPORT_STATUS.DRAFT, REPORT_STATUS.REVIEW])).order_by(
+        ExpenseReport.datetime.desc())
+
+
+def editable_expenses():
+    return Expense.query.join(ExpenseReport).filter(
+        ExpenseReport.id.in_(editable_reports().with_entities(ExpenseReport.id))).order_by(
+        ExpenseReport.datetime.desc(), Expense.seq)
+
+
+class ReceiptForm(Form):
+    """
+    Upload a receipt.
+    """
+    file = wtforms.FileField("Receipt", validators=[wtforms.validators.Required()],
+        description="A photo or scan of the bill")
+    report = QuerySelectField("Report", validators=[wtforms.validators.Required()],
+        query_factory=editable_reports, get_label='title', allow_blank=True,
+        description="Expense report this receipt is for")
+    expense = QuerySelectField("Expense", validators=[wtforms.validators.Optional()],
+        query_factory=editable_expenses, get_label='description', allow_blank=True,
+        description="The expense in this report that the receipt is for, if only one")
+
+    def validate_expense(self, field):
+        if field.data and self.report.data and field.data.report_id != self.report.data.id:
+            raise wtforms.ValidationError("This expense is not in the selected report")
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from flask import g
+import wtforms
+from wtforms.ext.sqlalchemy.fields import QuerySelectField
+from baseframe.forms import Form
+
+from kharcha.models import db, User, Balance
+from kharcha.forms.expenses import CURRENCIES
+
+__all__ = ['PaymentForm']
+
+
+def payees():
+    # Users who have had reports accepted or been paid in this workspace
+    return User.query.filter(User.id.in_(
+        db.session.query(Balance.user_id).filter(Balance.workspace_id == g.workspace.id))).order_by(User.fullname)
+
+
+class PaymentForm(Form):
+    """
+    Record a payment to a user.
+    """
+    user = QuerySelectField("Paid to", validators=[wtforms.validators.Required()],
+        query_factory=payees, get_label='fullname', allow_blank=True)
+    date = wtforms.DateField("Date", validators=[wtforms.validators.Required()],
+        description="Date on which the payment was made")
+    currency = wtforms.SelectField("Currency", validators=[wtforms.validators.Required()],
+        choices=CURRENCIES)
+    amount = wtforms.DecimalField("Amount", validators=[wtforms.validators.Required(),
+        wtforms.validators.NumberRange(min=0)])
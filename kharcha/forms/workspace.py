@@ -18,6 +18,16 @@ class NewWorkspaceForm(Form):
         description="The standard currency for your organization’s accounts. This cannot be changed later")
 
 
+def timezone_choices():
+    # pytz reads its list of zones on first use, so don't build this at import
+    global _timezone_choices
+    if _timezone_choices is None:
+        _timezone_choices = [(tz, tz) for tz in common_timezones]
+    return _timezone_choices
+
+_timezone_choices = None
+
+
 class WorkspaceForm(Form):
     """
     Manage workspace settings.
@@ -25,7 +35,6 @@ class WorkspaceForm(Form):
     description = RichTextField("Usage notes",
         description="Notes for your organization members on how to use this expense reporting tool")
     timezone = wtforms.SelectField("Timezone", validators=[wtforms.validators.Required("Select a timezone")],
-        choices=[(tz, tz) for tz in common_timezones],
         description="The primary timezone in which your organization is based")
     access_teams = QuerySelectMultipleField("Access Teams",
         validators=[wtforms.validators.Required("You need to select at least one team")], get_label='title',
@@ -38,6 +47,10 @@ class WorkspaceForm(Form):
         description="Teams with administrative access to this workspace. "
             "Admin access is required to create or edit budgets and categories")
 
+    def __init__(self, *args, **kwargs):
+        super(WorkspaceForm, self).__init__(*args, **kwargs)
+        self.timezone.choices = timezone_choices()
+
     def validate_admin_teams(self, field):
         if self.edit_obj.owners not in field.data:
             field.data.append(self.edit_obj.owners)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-request SQL instrumentation
+===============================
+
+Counts the SQL statements each request runs and the time spent in the
+database, and reports them:
+
+* in a ``Server-Timing`` header, which browser developer tools show next to
+  the request, when ``SERVER_TIMING`` is set (it is on in debug and testing
+  mode by default);
+* as one JSON line per request to the ``kharcha.sql`` logger;
+* as a warning when a statement runs ``SQL_REPEAT_THRESHOLD`` or more times
+  in one request. Statements are compared without their parameters, so this
+  catches lazy loads in a loop (N+1 queries), such as reading ``r.user``
+  for every report in a listing.
+
+When ``SQL_QUERY_BUDGET`` is set, requests running more statements than
+that are logged, and in testing mode fail with :exc:`QueryBudgetExceeded`
+so that a regression breaks the test that caused it.
+
+Streamed responses, such as CSV exports, are measured up to the start of
+the response body; statements run while streaming are not counted.
+"""
+
+import json
+import logging
+from collections import Counter
+from timeit import default_timer
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+__all__ = ['QueryBudgetExceeded', 'QueryStats', 'query_stats', 'init_app']
+
+logger = logging.getLogger('kharcha.sql')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryStats(object):
+    """
+    SQL statements run while handling one request.
+    """
+    def __init__(self):
+        self.started = default_timer()
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, threshold):
+        """
+        Statements run at least ``threshold`` times, most frequent first.
+        """
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+def query_stats():
+    """
+    Statistics for the current request, or None outside a request.
+    """
+    if not has_request_context():
+        return None
+    return getattr(g, '_kharcha_query_stats', None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('kharcha_query_started', []).append(default_timer())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['kharcha_query_started'].pop()
+    stats = query_stats()
+    if stats is not None:
+        stats.add(statement, default_timer() - started)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    started = context.connection.info.get('kharcha_query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _start_request():
+    g._kharcha_query_stats = QueryStats()
+
+
+def _finish_request(response):
+    app = current_app
+    stats = query_stats()
+    if stats is None:
+        return response
+    elapsed = default_timer() - stats.started
+    repeated = stats.repeated(app.config.get('SQL_REPEAT_THRESHOLD', 5))
+    budget = app.config.get('SQL_QUERY_BUDGET')
+    over_budget = budget is not None and stats.count > budget
+
+    if app.config.get('SERVER_TIMING', app.debug or app.testing):
+        response.headers.add('Server-Timing', 'db;desc="SQL (%d)";dur=%.1f' % (stats.count,
+            stats.duration * 1000))
+        response.headers.add('Server-Timing', 'app;dur=%.1f' % (elapsed * 1000))
+
+    record = {
+        'method': request.method,
+        'endpoint': request.endpoint,
+        'path': request.path,
+        'status': response.status_code,
+        'queries': stats.count,
+        'db_ms': round(stats.duration * 1000, 1),
+        'total_ms': round(elapsed * 1000, 1),
+        }
+    if repeated:
+        record['repeated'] = [{'statement': statement, 'count': count} for statement, count in repeated]
+    logger.log(logging.WARNING if repeated or over_budget else logging.INFO, json.dumps(record))
+
+    if over_budget and app.testing:
+        raise QueryBudgetExceeded("%s ran %d queries, over the budget of %d" % (
+            request.endpoint, stats.count, budget))
+    return response
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
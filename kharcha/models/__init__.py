@@ -1,13 +1,46 @@
 # -*- coding: utf-8 -*-
 
+from sqlalchemy.exc import IntegrityError
 from flask_sqlalchemy import SQLAlchemy
 from kharcha import app
-from coaster.sqlalchemy import BaseMixin, BaseNameMixin, BaseScopedNameMixin, BaseScopedIdNameMixin
+from coaster.sqlalchemy import BaseMixin, BaseNameMixin, BaseScopedNameMixin, BaseScopedIdMixin, BaseScopedIdNameMixin
 
 db = SQLAlchemy(app)
 
+
+def increment(connection, table, key, **deltas):
+    """
+    Add ``deltas`` to the named counter columns in the row of ``table``
+    identified by ``key`` (a dict of column values), inserting the row if it
+    doesn't exist yet. The addition is done by the database, so concurrent
+    increments are not lost, provided that ``table`` has a unique constraint
+    or index on the key columns that treats NULL as a value. Without one,
+    concurrent inserts of the same key make two rows and later increments
+    are counted twice.
+    """
+    where = db.and_(*[table.c[column].is_(None) if value is None else table.c[column] == value
+        for column, value in key.items()])
+    values = dict((column, table.c[column] + delta) for column, delta in deltas.items())
+    if connection.execute(table.update().where(where).values(values)).rowcount:
+        return
+    savepoint = connection.begin_nested()
+    try:
+        connection.execute(table.insert().values(dict(key, **deltas)))
+        savepoint.commit()
+    except IntegrityError:
+        # Another transaction inserted the row first
+        savepoint.rollback()
+        connection.execute(table.update().where(where).values(values))
+
+
 from kharcha.models.user import *
 from kharcha.models.workspace import *
+from kharcha.models.currency import *
 from kharcha.models.expenses import *
 from kharcha.models.settlements import *
 from kharcha.models.attachments import *
+from kharcha.models.listings import *
+from kharcha.models.rollups import *
+from kharcha.models.search import *
+from kharcha.models.notifications import *
+from kharcha.models.history import *
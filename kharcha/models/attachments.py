@@ -1,3 +1,123 @@
 # -*- coding: utf-8 -*-
 
-__all__ = []
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from kharcha.models import db, BaseMixin, BaseScopedIdMixin
+from kharcha.models.user import User
+from kharcha.models.expenses import ExpenseReport, Expense
+from kharcha.storage import store_stream, stored_path
+
+__all__ = ['JOB_STATUS', 'StoredFile', 'Receipt', 'DerivativeJob']
+
+
+# --- Constants ---------------------------------------------------------------
+
+class JOB_STATUS:
+    PENDING = 0
+    RUNNING = 1
+    DONE    = 2
+    FAILED  = 3
+
+
+# --- Models ------------------------------------------------------------------
+
+
+class StoredFile(BaseMixin, db.Model):
+    """
+    File contents in storage, identified by hash. Any number of receipts can
+    refer to the same file.
+    """
+    __tablename__ = 'stored_file'
+    #: SHA-256 hash of the contents, in hex
+    hash = db.Column(db.Unicode(64), nullable=False, unique=True)
+    #: Size in bytes
+    size = db.Column(db.BigInteger, nullable=False)
+    #: MIME type reported when first uploaded
+    mimetype = db.Column(db.Unicode(80), nullable=False)
+    #: Is a thumbnail available?
+    thumbnail = db.Column(db.Boolean, nullable=False, default=False)
+    #: Is a full size preview image available?
+    preview = db.Column(db.Boolean, nullable=False, default=False)
+
+    @property
+    def path(self):
+        return stored_path(self.hash)
+
+    @property
+    def processing(self):
+        """
+        Are derivatives of this file queued or being made?
+        """
+        return self.job is not None and self.job.status in (JOB_STATUS.PENDING, JOB_STATUS.RUNNING)
+
+    @classmethod
+    def store(cls, stream, mimetype):
+        """
+        Store the contents of a file-like object, returning the existing
+        record if the same contents have been stored before. New files are
+        queued for thumbnails and previews to be made.
+        """
+        hash, size = store_stream(stream)
+        stored = cls.query.filter_by(hash=hash).first()
+        if stored is None:
+            stored = cls(hash=hash, size=size, mimetype=mimetype)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(stored)
+                    db.session.add(DerivativeJob(file=stored))
+            except IntegrityError:
+                # The same contents were uploaded concurrently
+                stored = cls.query.filter_by(hash=hash).one()
+        return stored
+
+
+class Receipt(BaseScopedIdMixin, db.Model):
+    """
+    Receipt attached to an expense report, and optionally to one expense in
+    it.
+    """
+    __tablename__ = 'receipt'
+    report_id = db.Column(db.Integer, db.ForeignKey('expense_report.id'), nullable=False)
+    report = db.relation(ExpenseReport, backref=db.backref('receipts', cascade='all, delete-orphan'))
+    parent = db.synonym('report')
+    #: Expense this receipt is for
+    expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=True)
+    expense = db.relation(Expense, backref='receipts')
+    #: User who uploaded the receipt
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship(User, backref=db.backref('receipts', cascade='all, delete-orphan'))
+    #: Stored contents
+    file_id = db.Column(db.Integer, db.ForeignKey('stored_file.id'), nullable=False)
+    file = db.relationship(StoredFile, lazy='joined', backref=db.backref('receipts', lazy='dynamic'))
+    #: Name of the file as uploaded
+    filename = db.Column(db.Unicode(250), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('url_id', 'report_id'),)
+
+    def permissions(self, user, inherited=None):
+        # Receipts are as visible and editable as their report
+        return self.report.permissions(user, inherited)
+
+
+class DerivativeJob(BaseMixin, db.Model):
+    """
+    Queued work to make the thumbnail and preview of a stored file. Jobs are
+    run by ``manage.py receiptworker``, which claims them by setting their
+    status to running. Making derivatives is idempotent, so a job whose
+    worker died is run again, counting as a failed attempt.
+    """
+    __tablename__ = 'derivative_job'
+    file_id = db.Column(db.Integer, db.ForeignKey('stored_file.id'), nullable=False, unique=True)
+    file = db.relationship(StoredFile, backref=db.backref('job', uselist=False, cascade='all, delete-orphan'))
+    #: Status
+    status = db.Column(db.Integer, nullable=False, default=JOB_STATUS.PENDING)
+    #: Number of failed attempts
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    #: Don't run before this time (for retries)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    #: When a worker claimed this job
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    #: Error from the last failed attempt
+    error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (db.Index('ix_derivative_job_status_run_after', 'status', 'run_after'),)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import csv
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from kharcha import app
+from kharcha.models import db
+
+__all__ = ['ExchangeRate', 'exchange_rates', 'conversion_factor', 'load_exchange_rates']
+
+
+class ExchangeRate(db.Model):
+    """
+    Exchange rate of a currency against the base currency (the
+    ``EXCHANGE_RATE_BASE`` setting) on a date. Rates between any other two
+    currencies are derived from their rates against the base.
+    """
+    __tablename__ = 'exchange_rate'
+    id = db.Column(db.Integer, primary_key=True)
+    #: Date on which this rate applies
+    date = db.Column(db.Date, nullable=False)
+    #: Currency
+    currency = db.Column(db.Unicode(3), nullable=False)
+    #: Units of this currency per unit of the base currency
+    rate = db.Column(db.Numeric(18, 8), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('currency', 'date'),)
+
+
+#: Rates already looked up in this process, keyed by (currency, date). Dates
+#: without a known rate are not cached, so rates loaded later are found
+_rate_cache = {}
+
+
+def base_currency():
+    return app.config.get('EXCHANGE_RATE_BASE', 'USD')
+
+
+def exchange_rates(keys):
+    """
+    Look up rates for many ``(currency, date)`` pairs at once, using the
+    most recent rate on or before each date. Returns a dict with the same
+    keys and None where no rate is known. Pairs not already cached are
+    fetched with one query.
+    """
+    base = base_currency()
+    missing = set(key for key in keys if key[0] != base and key not in _rate_cache)
+    if missing:
+        if len(_rate_cache) > app.config.get('EXCHANGE_RATE_CACHE_SIZE', 100000):
+            _rate_cache.clear()
+        dates = defaultdict(list)
+        for currency, date in missing:
+            dates[currency].append(date)
+        # For each currency, fetch rates from the last one in effect on the
+        # earliest date needed, through to the latest date needed
+        earlier = db.aliased(ExchangeRate)
+        clauses = []
+        for currency, needed in dates.items():
+            start = db.session.query(db.func.max(earlier.date)).filter(
+                earlier.currency == currency, earlier.date <= min(needed)).as_scalar()
+            clauses.append(db.and_(ExchangeRate.currency == currency,
+                ExchangeRate.date >= db.func.coalesce(start, min(needed)),
+                ExchangeRate.date <= max(needed)))
+        history = defaultdict(list)
+        for currency, date, rate in db.session.query(
+                ExchangeRate.currency, ExchangeRate.date, ExchangeRate.rate).filter(
+                db.or_(*clauses)).order_by(ExchangeRate.date):
+            history[currency].append((date, rate))
+        for currency, date in missing:
+            rates = history[currency]
+            index = bisect_right([d for d, r in rates], date)
+            if index:
+                _rate_cache[(currency, date)] = rates[index - 1][1]
+
+    return dict((key, Decimal(1) if key[0] == base else _rate_cache.get(key)) for key in keys)
+
+
+def conversion_factor(currency_from, currency_to, date):
+    """
+    Multiplier to convert amounts from one currency to another on a date,
+    or None if either rate is unknown.
+    """
+    if currency_from == currency_to:
+        return Decimal(1)
+    rates = exchange_rates([(currency_from, date), (currency_to, date)])
+    if rates[(currency_from, date)] is None or rates[(currency_to, date)] is None:
+        return None
+    return rates[(currency_to, date)] / rates[(currency_from, date)]
+
+
+def load_exchange_rates(infile, chunk=1000):
+    """
+    Load rates from a CSV file with ``date`` (YYYY-MM-DD), ``currency`` and
+    ``rate`` columns, replacing existing rates for the same currency and
+    date. Returns the number of rates read.
+    """
+    count = 0
+    batch = {}
+    for row in csv.DictReader(infile):
+        date = datetime.strptime(row['date'], '%Y-%m-%d').date()
+        batch[(row['currency'].strip().upper(), date)] = Decimal(row['rate'])
+        count += 1
+        if len(batch) >= chunk:
+            _save_rates(batch)
+            batch = {}
+    if batch:
+        _save_rates(batch)
+    _rate_cache.clear()
+    return count
+
+
+def _save_rates(batch):
+    existing = dict(((r.currency, r.date), r) for r in ExchangeRate.query.filter(
+        db.tuple_(ExchangeRate.currency, ExchangeRate.date).in_(list(batch.keys()))))
+    for (currency, date), rate in batch.items():
+        if (currency, date) in existing:
+            existing[(currency, date)].rate = rate
+        else:
+            db.session.add(ExchangeRate(currency=currency, date=date, rate=rate))
+    db.session.flush()
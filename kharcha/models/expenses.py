@@ -2,11 +2,14 @@
 
 from decimal import Decimal
 from datetime import datetime
+from sqlalchemy.sql.expression import ClauseElement
 from kharcha.models import db, BaseMixin, BaseScopedNameMixin, BaseScopedIdNameMixin
 from kharcha.models.user import User
 from kharcha.models.workspace import Workspace
+from kharcha.models.currency import exchange_rates, conversion_factor
+from kharcha.permissions import cached_permissions
 
-__all__ = ['REPORT_STATUS', 'Budget', 'Category', 'ExpenseReport', 'Expense']
+__all__ = ['REPORT_STATUS', 'SEQ_GAP', 'Budget', 'Category', 'ExpenseReport', 'Expense']
 
 
 # --- Constants ---------------------------------------------------------------
@@ -21,6 +24,11 @@ class REPORT_STATUS:
     CLOSED    = 6
 
 
+#: Spacing between sequence numbers of consecutive expenses, leaving room to
+#: move an expense between two others without renumbering the rest
+SEQ_GAP = 1024
+
+
 # --- Models ------------------------------------------------------------------
 
 class Budget(BaseScopedNameMixin, db.Model):
@@ -70,32 +78,151 @@ class ExpenseReport(BaseScopedIdNameMixin, db.Model):
     description = db.Column(db.Text, nullable=False, default='')
     #: Total value in the report's currency
     total_value = db.Column(db.Numeric(10, 2), nullable=False, default=Decimal('0.0'))
-    #: Total value in the organization's preferred currency
-    total_converted = db.Column(db.Numeric(10, 2), nullable=False, default=Decimal('0.0'))
+    #: Total value in the organization's preferred currency, None if no
+    #: exchange rate is known
+    total_converted = db.Column(db.Numeric(10, 2), nullable=True, default=Decimal('0.0'))
     #: Reviewer
     reviewer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     reviewer = db.relationship(User, primaryjoin=reviewer_id == User.id,
         backref=db.backref('reviewed_reports', cascade='all'))  # No delete-orphan
     #: Reviewer notes
     notes = db.Column(db.Text, nullable=False, default='')  # HTML notes
-    #: Status
-    status = db.Column(db.Integer, nullable=False, default=REPORT_STATUS.DRAFT)
+    #: Status. The old value is loaded before it is replaced, even if the
+    #: report was expired, so that status changes can be logged
+    status = db.column_property(db.Column(db.Integer, nullable=False, default=REPORT_STATUS.DRAFT),
+        active_history=True)
+    #: Highest sequence number allocated to an expense in this report
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
 
-    __table_args__ = (db.UniqueConstraint('url_id', 'workspace_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('url_id', 'workspace_id'),
+        # Report listings, filtered by state and sorted newest first
+        db.Index('ix_expense_report_workspace_status_datetime', 'workspace_id', 'status', 'datetime', 'id'),
+        db.Index('ix_expense_report_workspace_user_status_datetime',
+            'workspace_id', 'user_id', 'status', 'datetime', 'id'),
+        db.Index('ix_expense_report_budget_status_datetime', 'budget_id', 'status', 'datetime'),
+        )
 
     def update_total(self):
-        self.total_value = sum([e.amount for e in self.expenses])
-        # self.total_value = db.session.query(
-        #     db.func.sum(Expense.amount).label('sum')).filter_by(
-        #         report_id = self.id).first().sum
-
-    def update_sequence_numbers(self):
-        # self.expenses is ordered by seq. See the relation defined at Expense.report
-        for i, expense in enumerate(self.expenses):
-            # Only edit the object if its sequence position has changed
-            if expense.seq != i + 1:
-                expense.seq = i + 1
+        """
+        Recompute the total from this report's expenses with a SQL aggregate.
+        Routine changes should use :meth:`adjust_total` instead.
+        """
+        self.total_value = db.session.query(db.func.coalesce(db.func.sum(Expense.amount), 0)).filter(
+            Expense.report_id == self.id).as_scalar()
+        self.update_converted()
+
+    def adjust_total(self, delta):
+        """
+        Add ``delta`` to the total. The addition happens in the database when
+        the report is flushed, so concurrent changes to other expenses in the
+        report are not lost and no expenses need to be read.
+        """
+        if delta:
+            total = self.__dict__.get('total_value')
+            if isinstance(total, ClauseElement):
+                # Already adjusted in this transaction and not flushed yet
+                self.total_value = total + delta
+            else:
+                self.total_value = ExpenseReport.total_value + delta
+            self.update_converted()
+
+    def update_converted(self):
+        """
+        Set the converted total from the total, using the exchange rate
+        between the report's and the workspace's currencies on the report
+        date. Like :meth:`adjust_total`, the multiplication happens in the
+        database, so it always applies to the total being saved. Set to None
+        if no exchange rate is known, until :meth:`convert_totals` is run
+        after loading rates.
+        """
+        factor = conversion_factor(self.currency, self.workspace.currency,
+            (self.datetime or datetime.utcnow()).date())
+        if factor is None:
+            self.total_converted = None
+        else:
+            total = self.__dict__.get('total_value')
+            if self.id is None:
+                total = total or 0
+            elif not isinstance(total, ClauseElement):
+                total = ExpenseReport.total_value
+            self.total_converted = total * factor
+
+    @classmethod
+    def convert_totals(cls, batch=500):
+        """
+        Recompute converted totals for all reports, for use after loading
+        exchange rates. Reports are read in batches in id order, rates for a
+        batch are looked up together, and each batch is written with a
+        single UPDATE. Reports without known rates are set to None. Yields
+        the number of reports done after each batch.
+        """
+        last_id = 0
+        done = 0
+        while True:
+            rows = db.session.query(cls.id, cls.currency, cls.datetime, Workspace.currency).join(
+                Workspace, cls.workspace_id == Workspace.id).filter(
+                cls.id > last_id).order_by(cls.id).limit(batch).all()
+            if not rows:
+                break
+            rates = exchange_rates(set((currency, dt.date()) for row in rows
+                for currency, dt in ((row[1], row[2]), (row[3], row[2]))))
+            factors = {}
+            for report_id, currency, dt, workspace_currency in rows:
+                rate_from, rate_to = rates[(currency, dt.date())], rates[(workspace_currency, dt.date())]
+                if currency == workspace_currency:
+                    factors[report_id] = Decimal(1)
+                elif rate_from is not None and rate_to is not None:
+                    factors[report_id] = rate_to / rate_from
+            # Reports missing from the CASE get NULL
+            db.session.query(cls).filter(cls.id.in_([row[0] for row in rows])).update(
+                {'total_converted': cls.total_value * db.case(factors, value=cls.id) if factors else None},
+                synchronize_session=False)
+            last_id = rows[-1][0]
+            done += len(rows)
+            yield done
 
+    def allocate_seq(self, count=1):
+        """
+        Reserve ``count`` sequence numbers at the end of this report and
+        return the first. The counter is bumped in a single UPDATE, which
+        holds the report's row lock until commit, so concurrent requests can
+        never be handed the same number.
+        """
+        db.session.query(ExpenseReport).filter_by(id=self.id).update(
+            {'last_seq': ExpenseReport.last_seq + SEQ_GAP * count}, synchronize_session=False)
+        db.session.expire(self, ['last_seq'])
+        return self.last_seq - SEQ_GAP * (count - 1)
+
+    def reorder_expenses(self, ids):
+        """
+        Renumber this report's expenses to follow the order of ``ids``, in
+        one UPDATE statement.
+        """
+        if not ids:
+            return
+        db.session.query(Expense).filter(Expense.report_id == self.id, Expense.id.in_(ids)).update(
+            {'seq': db.case(dict((expense_id, (index + 1) * SEQ_GAP) for index, expense_id in enumerate(ids)),
+                value=Expense.id)},
+            synchronize_session=False)
+        # Never move the counter backwards, in case an expense was added meanwhile
+        last_seq = len(ids) * SEQ_GAP
+        self.last_seq = db.case([(ExpenseReport.last_seq < last_seq, last_seq)], else_=ExpenseReport.last_seq)
+        db.session.expire(self, ['expenses'])
+
+    @classmethod
+    def visible_to(cls, user):
+        """
+        SQL criterion for reports ``user`` can view, matching
+        :meth:`permissions`: their own reports, and reports past the draft
+        stage in workspaces where they are a reviewer or admin.
+        """
+        if user is None:
+            return db.false()
+        return db.or_(cls.user_id == user.id, db.and_(cls.status != REPORT_STATUS.DRAFT,
+            Workspace.role_filter(user, ('review', 'admin'), cls.workspace_id)))
+
+    @cached_permissions('status')
     def permissions(self, user, inherited=None):
         perms = super(ExpenseReport, self).permissions(user, inherited)
 
@@ -145,6 +272,11 @@ class Expense(BaseMixin, db.Model):
     report = db.relationship(ExpenseReport, primaryjoin=report_id == ExpenseReport.id,
         backref=db.backref('expenses', cascade='all, delete-orphan', order_by=seq))
 
+    __table_args__ = (
+        db.Index('ix_expense_report_seq', 'report_id', 'seq'),
+        db.Index('ix_expense_category_date', 'category_id', 'date'),
+        )
+
     def permissions(self, user, inherited=None):
         perms = super(Expense, self).permissions(user, inherited)
         # Expenses can be deleted only if the report can be edited
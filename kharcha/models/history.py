@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from flask import g, has_app_context
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from kharcha.models import db
+from kharcha.models.user import User
+from kharcha.models.expenses import REPORT_STATUS, ExpenseReport
+
+__all__ = ['REVIEW_OUTCOMES', 'seconds_between', 'ReportTransition']
+
+#: Statuses a reviewer moves pending reports to
+REVIEW_OUTCOMES = (REPORT_STATUS.ACCEPTED, REPORT_STATUS.REVIEW, REPORT_STATUS.REJECTED)
+
+
+class seconds_between(FunctionElement):
+    """
+    SQL expression for the number of seconds from one timestamp to another.
+    """
+    type = db.Float()
+    name = 'seconds_between'
+
+
+@compiles(seconds_between, 'postgresql')
+def _seconds_between_postgresql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return 'EXTRACT(EPOCH FROM (%s - %s))' % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+@compiles(seconds_between, 'sqlite')
+def _seconds_between_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return '((julianday(%s) - julianday(%s)) * 86400.0)' % (compiler.process(end, **kw),
+        compiler.process(start, **kw))
+
+
+class ReportTransition(db.Model):
+    """
+    Append-only log of changes to the status of expense reports, one row per
+    workflow transition, written as the report is saved. Rows are small and
+    written in time order, so on PostgreSQL the time index is a BRIN index,
+    a fraction of the size of a B-tree.
+    """
+    __tablename__ = 'report_transition'
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('expense_report.id'), nullable=False)
+    report = db.relationship(ExpenseReport, backref=db.backref('transitions', cascade='all, delete-orphan',
+        order_by=id))
+    #: Status before the transition, None when the report was created
+    from_status = db.Column(db.SmallInteger, nullable=True)
+    #: Status after the transition
+    to_status = db.Column(db.SmallInteger, nullable=False)
+    #: User who made the transition
+    actor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    actor = db.relationship(User)
+    #: When the transition was made
+    datetime = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_report_transition_datetime', 'datetime', postgresql_using='brin'),
+        db.Index('ix_report_transition_report_datetime', 'report_id', 'datetime'),
+        )
+
+    @classmethod
+    def time_in_status(cls, status, workspace_id=None, since=None, ended_in=None):
+        """
+        Query for how long reports stayed in ``status`` before moving on,
+        per user who moved them on: rows of user id, number of reports, and
+        average and longest time in seconds. Each stay is paired with the
+        transition that ended it by a window function, so no history is read
+        into Python. ``since`` limits this to stays that began at or after a
+        time, and ``ended_in`` to stays that ended with a move to one of the
+        given statuses. For the pending status, ``ended_in`` defaults to
+        :data:`REVIEW_OUTCOMES`, so that the users are reviewers and owners
+        withdrawing their own reports are left out.
+        """
+        if ended_in is None and status == REPORT_STATUS.PENDING:
+            ended_in = REVIEW_OUTCOMES
+        table = cls.__table__
+        window = dict(partition_by=table.c.report_id, order_by=(table.c.datetime, table.c.id))
+        stays = db.select([table.c.to_status, table.c.datetime.label('entered_at'),
+            db.func.lead(table.c.datetime).over(**window).label('left_at'),
+            db.func.lead(table.c.actor_id).over(**window).label('left_by'),
+            db.func.lead(table.c.to_status).over(**window).label('left_to')])
+        if workspace_id is not None:
+            report = ExpenseReport.__table__
+            stays = stays.select_from(table.join(report, table.c.report_id == report.c.id)).where(
+                report.c.workspace_id == workspace_id)
+        if since is not None:
+            # Later transitions of the same report are also after this, so the
+            # window still sees the transition that ended each stay
+            stays = stays.where(table.c.datetime >= since)
+        stays = stays.alias('stays')
+        duration = seconds_between(stays.c.entered_at, stays.c.left_at)
+        query = db.session.query(stays.c.left_by, db.func.count(), db.func.avg(duration),
+            db.func.max(duration)).filter(stays.c.to_status == status, stays.c.left_at != None)  # NOQA
+        if ended_in is not None:
+            query = query.filter(stays.c.left_to.in_(ended_in))
+        return query.group_by(stays.c.left_by)
+
+
+# --- Recording transitions ---------------------------------------------------
+
+def _actor_id():
+    user = getattr(g, 'user', None) if has_app_context() else None
+    return user.id if user is not None else None
+
+
+def _record(connection, report_id, from_status, to_status):
+    connection.execute(ReportTransition.__table__.insert().values(report_id=report_id, from_status=from_status,
+        to_status=to_status, actor_id=_actor_id(), datetime=datetime.utcnow()))
+
+
+@db.event.listens_for(ExpenseReport, 'after_insert')
+def _report_created(mapper, connection, target):
+    _record(connection, target.id, None, target.status)
+
+
+@db.event.listens_for(ExpenseReport, 'after_update')
+def _report_updated(mapper, connection, target):
+    history = db.inspect(target).attrs.status.history
+    if history.deleted and history.deleted[0] != target.status:
+        _record(connection, target.id, history.deleted[0], target.status)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from kharcha.models.user import User
+from kharcha.models.expenses import Budget, ExpenseReport
+
+__all__ = ['ReportRow', 'report_rows']
+
+
+_report_columns = (
+    ExpenseReport.id,
+    ExpenseReport.url_id,
+    ExpenseReport.name,
+    ExpenseReport.title,
+    ExpenseReport.datetime,
+    ExpenseReport.status,
+    ExpenseReport.currency,
+    ExpenseReport.total_value,
+    User.fullname.label('user_fullname'),
+    Budget.title.label('budget_title'),
+    )
+
+
+class ReportRow(namedtuple('ReportRow', [c.key for c in _report_columns])):
+    """
+    Read-only expense report as shown in listings. Carries only the columns
+    the listing tables display, with the owner's name and budget title
+    already joined in.
+    """
+    __slots__ = ()
+
+    @property
+    def url_name(self):
+        return '%d-%s' % (self.url_id, self.name)
+
+
+def report_rows(query, limit=None, offset=None):
+    """
+    Run an :class:`ExpenseReport` query as a listing, returning
+    :class:`ReportRow` instances. Owner and budget are joined in the same
+    statement, so a listing takes one query regardless of its length.
+    """
+    query = query.join(User, ExpenseReport.user_id == User.id).outerjoin(
+        Budget, ExpenseReport.budget_id == Budget.id).with_entities(*_report_columns)
+    if limit is not None:
+        query = query.limit(limit)
+    if offset:
+        query = query.offset(offset)
+    return [ReportRow(*row) for row in query]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from kharcha.models import db, BaseMixin
+from kharcha.models.user import User
+from kharcha.models.expenses import ExpenseReport
+
+__all__ = ['NotificationEvent']
+
+
+class NotificationEvent(BaseMixin, db.Model):
+    """
+    Outbox of notifications about expense reports. Events are written in the
+    same transaction as the change they describe and mailed later by
+    ``manage.py sendnotifications``, so requests never wait on the mail
+    server and no notification is lost if a request fails.
+    """
+    __tablename__ = 'notification_event'
+    report_id = db.Column(db.Integer, db.ForeignKey('expense_report.id'), nullable=False)
+    report = db.relation(ExpenseReport, backref=db.backref('notifications', cascade='all, delete-orphan'))
+    #: User whose action caused the event
+    actor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    actor = db.relationship(User, primaryjoin=actor_id == User.id)
+    #: User to be notified
+    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    recipient = db.relationship(User, primaryjoin=recipient_id == User.id,
+        backref=db.backref('notifications', cascade='all, delete-orphan'))
+    #: Name of the workflow transition
+    event = db.Column(db.Unicode(40), nullable=False)
+    #: When this event was mailed, None if not yet
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_notification_event_sent_at_recipient', 'sent_at', 'recipient_id'),
+        )
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+from decimal import Decimal
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from kharcha.models import db, increment
+from kharcha.models.workspace import Workspace
+from kharcha.models.expenses import Budget, Category, ExpenseReport, Expense
+
+__all__ = ['month_start', 'SpendRollup']
+
+
+class month_start(FunctionElement):
+    """
+    SQL expression for the first day of the month of a date.
+    """
+    type = db.Date()
+    name = 'month_start'
+
+
+@compiles(month_start, 'postgresql')
+def _month_start_postgresql(element, compiler, **kw):
+    return "CAST(date_trunc('month', %s) AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start, 'sqlite')
+def _month_start_sqlite(element, compiler, **kw):
+    return "date(%s, 'start of month')" % compiler.process(element.clauses, **kw)
+
+
+class SpendRollup(db.Model):
+    """
+    Total spend per budget, category, month, report status and currency.
+    Rows are updated incrementally as expenses and reports change, so
+    summaries never have to scan expense line items.
+    """
+    __tablename__ = 'spend_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    workspace_id = db.Column(db.Integer, db.ForeignKey('workspace.id'), nullable=False)
+    workspace = db.relation(Workspace, backref=db.backref('spend_rollups', cascade='all, delete-orphan'))
+    #: Budget of the reports, None for reports without one
+    budget_id = db.Column(db.Integer, db.ForeignKey('budget.id'), nullable=True)
+    budget = db.relation(Budget, backref=db.backref('spend_rollups', cascade='all, delete-orphan'))
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    category = db.relation(Category, backref=db.backref('spend_rollups', cascade='all, delete-orphan'))
+    #: First day of the month in which the expenses were incurred
+    month = db.Column(db.Date, nullable=False)
+    #: Status of the reports
+    status = db.Column(db.Integer, nullable=False)
+    #: Currency of the reports
+    currency = db.Column(db.Unicode(3), nullable=False)
+    #: Sum of expense amounts
+    amount = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.0'))
+    #: Number of expenses
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # NULLs are distinct in unique constraints, so a constraint on the
+        # columns would let concurrent increments insert two rows for the
+        # same key without a budget. Index budget_id as 0 instead
+        db.Index('ix_spend_rollup_key', 'workspace_id', db.func.coalesce(budget_id, 0), 'category_id', 'month',
+            'status', 'currency', unique=True),
+        db.Index('ix_spend_rollup_category_month', 'category_id', 'month'),
+        )
+
+    @classmethod
+    def add(cls, connection, report_key, spend, sign=1):
+        """
+        Add ``spend``, a dict of ``{(category_id, month): (amount, count)}``,
+        to the rollups for a report described by ``report_key`` (a dict with
+        ``workspace_id``, ``budget_id``, ``status`` and ``currency``).
+        """
+        for (category_id, month), (amount, count) in spend.items():
+            key = dict(report_key, category_id=category_id, month=month)
+            increment(connection, cls.__table__, key, amount=amount * sign, count=count * sign)
+
+    @classmethod
+    def report_spend(cls, connection, report_id):
+        """
+        Spend in one report, grouped by category and month.
+        """
+        expense = Expense.__table__
+        spend = defaultdict(lambda: (0, 0))
+        for category_id, date, amount, count in connection.execute(
+                db.select([expense.c.category_id, expense.c.date,
+                    db.func.sum(expense.c.amount), db.func.count(expense.c.id)]).where(
+                    expense.c.report_id == report_id).group_by(expense.c.category_id, expense.c.date)):
+            key = (category_id, date.replace(day=1))
+            spend[key] = (spend[key][0] + amount, spend[key][1] + count)
+        return spend
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute all rollups from expenses, for use after loading data
+        without going through the ORM.
+        """
+        month = month_start(Expense.date)
+        query = db.session.query(ExpenseReport.workspace_id, ExpenseReport.budget_id, Expense.category_id,
+            month, ExpenseReport.status, ExpenseReport.currency,
+            db.func.sum(Expense.amount), db.func.count(Expense.id)).join(
+            Expense, Expense.report_id == ExpenseReport.id).group_by(
+            ExpenseReport.workspace_id, ExpenseReport.budget_id, Expense.category_id,
+            month, ExpenseReport.status, ExpenseReport.currency)
+        db.session.query(cls).delete(synchronize_session=False)
+        db.session.execute(cls.__table__.insert().from_select(
+            ['workspace_id', 'budget_id', 'category_id', 'month', 'status', 'currency', 'amount', 'count'],
+            query.statement))
+
+
+# --- Incremental updates -----------------------------------------------------
+
+def _report_key(connection, report_id):
+    report = ExpenseReport.__table__
+    return dict(connection.execute(db.select(
+        [report.c.workspace_id, report.c.budget_id, report.c.status, report.c.currency]).where(
+        report.c.id == report_id)).first())
+
+
+def _old_value(state, attr):
+    history = state.attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(state.obj(), attr)
+
+
+@db.event.listens_for(Expense, 'after_insert')
+def _expense_inserted(mapper, connection, target):
+    SpendRollup.add(connection, _report_key(connection, target.report_id),
+        {(target.category_id, target.date.replace(day=1)): (target.amount, 1)})
+
+
+@db.event.listens_for(Expense, 'after_delete')
+def _expense_deleted(mapper, connection, target):
+    SpendRollup.add(connection, _report_key(connection, target.report_id),
+        {(target.category_id, target.date.replace(day=1)): (target.amount, 1)}, sign=-1)
+
+
+@db.event.listens_for(Expense, 'after_update')
+def _expense_updated(mapper, connection, target):
+    state = db.inspect(target)
+    attrs = ('report_id', 'category_id', 'date', 'amount')
+    if not any(state.attrs[attr].history.has_changes() for attr in attrs):
+        return
+    old_report_id, old_category_id, old_date, old_amount = [_old_value(state, attr) for attr in attrs]
+    SpendRollup.add(connection, _report_key(connection, old_report_id),
+        {(old_category_id, old_date.replace(day=1)): (old_amount, 1)}, sign=-1)
+    SpendRollup.add(connection, _report_key(connection, target.report_id),
+        {(target.category_id, target.date.replace(day=1)): (target.amount, 1)})
+
+
+@db.event.listens_for(ExpenseReport, 'after_update')
+def _report_updated(mapper, connection, target):
+    # Reports are flushed before their expenses, so any expense changes in
+    # the same flush are applied afterwards against the report's new values
+    state = db.inspect(target)
+    attrs = ('workspace_id', 'budget_id', 'status', 'currency')
+    if not any(state.attrs[attr].history.has_changes() for attr in attrs):
+        return
+    spend = SpendRollup.report_spend(connection, target.id)
+    SpendRollup.add(connection, dict((attr, _old_value(state, attr)) for attr in attrs), spend, sign=-1)
+    SpendRollup.add(connection, dict((attr, getattr(target, attr)) for attr in attrs), spend)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+Full-text search over report titles and descriptions and expense
+descriptions. Indexes are maintained by the database as rows change:
+
+* on PostgreSQL, by GIN indexes on ``to_tsvector`` expressions, which
+  queries repeat exactly so that the planner uses them;
+* on SQLite, by FTS5 tables that use the indexed tables as their content,
+  kept in sync by triggers.
+
+The indexes are made by ``db.create_all()`` and by migrations.
+"""
+
+from kharcha.models import db
+from kharcha.models.expenses import ExpenseReport, Expense
+
+__all__ = ['SEARCH_CONFIG', 'search_ddl', 'search_hits', 'matching_expenses']
+
+#: PostgreSQL text search configuration, for stemming and stop words
+SEARCH_CONFIG = 'english'
+
+#: Columns indexed in each table
+SEARCH_COLUMNS = (
+    ('expense_report', ('title', 'description')),
+    ('expense', ('description',)),
+    )
+
+
+def _vector(table, columns, qualify=False):
+    prefix = table + '.' if qualify else ''
+    return "to_tsvector('%s', %s)" % (SEARCH_CONFIG, " || ' ' || ".join(prefix + column for column in columns))
+
+
+def _table_ddl(dialect, table, columns):
+    if dialect == 'postgresql':
+        return ['CREATE INDEX IF NOT EXISTS ix_%s_search ON %s USING gin (%s)' % (
+            table, table, _vector(table, columns))]
+    elif dialect == 'sqlite':
+        fts = table + '_search'
+        names = ', '.join(columns)
+        new = ', '.join('new.' + column for column in columns)
+        old = ', '.join('old.' + column for column in columns)
+        insert = 'INSERT INTO %s (rowid, %s) VALUES (new.id, %s);' % (fts, names, new)
+        delete = "INSERT INTO %s (%s, rowid, %s) VALUES ('delete', old.id, %s);" % (fts, fts, names, old)
+        return [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', content_rowid='id', "
+            "tokenize='porter unicode61')" % (fts, names, table),
+            'CREATE TRIGGER IF NOT EXISTS %s_insert AFTER INSERT ON %s BEGIN %s END' % (fts, table, insert),
+            'CREATE TRIGGER IF NOT EXISTS %s_delete AFTER DELETE ON %s BEGIN %s END' % (fts, table, delete),
+            'CREATE TRIGGER IF NOT EXISTS %s_update AFTER UPDATE OF %s ON %s BEGIN %s %s END' % (
+                fts, names, table, delete, insert),
+            "INSERT INTO %s (%s) VALUES ('rebuild')" % (fts, fts),
+            ]
+    return []
+
+
+def search_ddl(dialect):
+    """
+    Statements that make the search indexes on a database of the given
+    dialect, and index existing rows.
+    """
+    statements = []
+    for table, columns in SEARCH_COLUMNS:
+        statements.extend(_table_ddl(dialect, table, columns))
+    return statements
+
+
+# On the indexed tables rather than the metadata, so that the indexes are
+# made only along with their tables, and db.create_all() can be run again
+@db.event.listens_for(ExpenseReport.__table__, 'after_create')
+@db.event.listens_for(Expense.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    for statement in _table_ddl(connection.dialect.name, target.name, dict(SEARCH_COLUMNS)[target.name]):
+        connection.execute(statement)
+
+
+@db.event.listens_for(ExpenseReport.__table__, 'before_drop')
+@db.event.listens_for(Expense.__table__, 'before_drop')
+def _drop_search_table(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute('DROP TABLE IF EXISTS %s_search' % target.name)
+
+
+def _fts5_query(terms):
+    # Quote every word so that FTS5 query syntax in the input is searched
+    # for literally. Words are ANDed, like plainto_tsquery on PostgreSQL
+    return u' '.join(u'"%s"' % word.replace(u'"', u'""') for word in terms.split())
+
+
+def _fts5_match(table, terms):
+    fts = table + '_search'
+    return db.table(fts, db.column('rowid')), db.literal_column(fts).match(_fts5_query(terms))
+
+
+def search_hits(terms, workspace_id):
+    """
+    Select ``report_id`` and ``rank`` for each report in the workspace whose
+    title or description matches ``terms``, and for each matching expense.
+    Higher ranks are better matches. A report may appear more than once.
+    """
+    report = ExpenseReport.__table__
+    expense = Expense.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        tsquery = db.func.plainto_tsquery(SEARCH_CONFIG, terms)
+        report_vector = db.literal_column(_vector('expense_report', SEARCH_COLUMNS[0][1], qualify=True))
+        expense_vector = db.literal_column(_vector('expense', SEARCH_COLUMNS[1][1], qualify=True))
+        report_hits = db.select([report.c.id.label('report_id'),
+            db.func.ts_rank(report_vector, tsquery).label('rank')]).where(db.and_(
+            report.c.workspace_id == workspace_id, report_vector.op('@@')(tsquery)))
+        expense_hits = db.select([expense.c.report_id, db.func.ts_rank(expense_vector, tsquery)]).select_from(
+            expense.join(report, expense.c.report_id == report.c.id)).where(db.and_(
+            report.c.workspace_id == workspace_id, expense_vector.op('@@')(tsquery)))
+    elif dialect == 'sqlite':
+        # bm25() scores are lower for better matches
+        fts, match = _fts5_match('expense_report', terms)
+        report_hits = db.select([fts.c.rowid.label('report_id'),
+            (-db.func.bm25(db.literal_column('expense_report_search'))).label('rank')]).select_from(
+            fts.join(report, report.c.id == fts.c.rowid)).where(db.and_(
+            report.c.workspace_id == workspace_id, match))
+        fts, match = _fts5_match('expense', terms)
+        expense_hits = db.select([expense.c.report_id,
+            -db.func.bm25(db.literal_column('expense_search'))]).select_from(
+            fts.join(expense, expense.c.id == fts.c.rowid).join(report, expense.c.report_id == report.c.id)).where(
+            db.and_(report.c.workspace_id == workspace_id, match))
+    else:
+        raise NotImplementedError("Search is not available on %s" % dialect)
+    return db.union_all(report_hits, expense_hits)
+
+
+def matching_expenses(terms, report_ids):
+    """
+    Query for expenses matching ``terms`` in the given reports.
+    """
+    query = Expense.query.filter(Expense.report_id.in_(report_ids))
+    if db.engine.dialect.name == 'postgresql':
+        expense_vector = db.literal_column(_vector('expense', SEARCH_COLUMNS[1][1], qualify=True))
+        query = query.filter(expense_vector.op('@@')(db.func.plainto_tsquery(SEARCH_CONFIG, terms)))
+    else:
+        fts, match = _fts5_match('expense', terms)
+        query = query.filter(Expense.id.in_(db.select([fts.c.rowid]).where(match)))
+    return query.order_by(Expense.report_id, Expense.seq)
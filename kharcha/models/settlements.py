@@ -1,17 +1,23 @@
 # -*- coding: utf-8 -*-
 
-from kharcha.models import db, BaseMixin
+from datetime import datetime
+from decimal import Decimal
+from kharcha.models import db, BaseMixin, increment
 from kharcha.models.user import User
 from kharcha.models.workspace import Workspace
+from kharcha.models.expenses import REPORT_STATUS, ExpenseReport
 
-__all__ = ['Payment']
+__all__ = ['SETTLED_STATUSES', 'Payment', 'Balance']
+
+#: Report states in which the total is owed to the report's owner
+SETTLED_STATUSES = (REPORT_STATUS.ACCEPTED, REPORT_STATUS.CLOSED)
 
 
 class Payment(BaseMixin, db.Model):
     __tablename__ = 'payment'
     workspace_id = db.Column(db.Integer, db.ForeignKey('workspace.id'), nullable=False)
     workspace = db.relation(Workspace, backref=db.backref('payments', cascade='all, delete-orphan'))
-    #: User who made the payment
+    #: User who was paid
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship(User, primaryjoin=user_id == User.id,
         backref=db.backref('payouts', cascade='all, delete-orphan'))
@@ -21,3 +27,100 @@ class Payment(BaseMixin, db.Model):
     currency = db.Column(db.Unicode(3), nullable=False, default='INR')
     #: Amount of payment
     amount = db.Column(db.Numeric(10, 2), default=0, nullable=False)
+
+
+class Balance(BaseMixin, db.Model):
+    """
+    Running totals of what a workspace owes a user in one currency. Rows are
+    updated incrementally as reports are accepted and payments recorded, so
+    balances never have to be computed from history.
+    """
+    __tablename__ = 'balance'
+    workspace_id = db.Column(db.Integer, db.ForeignKey('workspace.id'), nullable=False)
+    workspace = db.relation(Workspace, backref=db.backref('balances', cascade='all, delete-orphan'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship(User, backref=db.backref('balances', cascade='all, delete-orphan'))
+    currency = db.Column(db.Unicode(3), nullable=False)
+    #: Total of accepted and closed reports
+    due = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.0'))
+    #: Total of payments
+    paid = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal('0.0'))
+
+    __table_args__ = (db.UniqueConstraint('workspace_id', 'user_id', 'currency'),)
+
+    @property
+    def outstanding(self):
+        return self.due - self.paid
+
+    @classmethod
+    def add(cls, connection, workspace_id, user_id, currency, due=0, paid=0):
+        key = dict(workspace_id=workspace_id, user_id=user_id, currency=currency)
+        increment(connection, cls.__table__, key, due=due, paid=paid)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute all balances from reports and payments, for use after
+        loading data without going through the ORM.
+        """
+        report = ExpenseReport.__table__
+        payment = Payment.__table__
+        entries = db.union_all(
+            db.select([report.c.workspace_id, report.c.user_id, report.c.currency,
+                report.c.total_value.label('due'), db.literal(0).label('paid')]).where(
+                report.c.status.in_(SETTLED_STATUSES)),
+            db.select([payment.c.workspace_id, payment.c.user_id, payment.c.currency,
+                db.literal(0).label('due'), payment.c.amount.label('paid')])
+            ).alias('entries')
+        now = datetime.utcnow()
+        db.session.query(cls).delete(synchronize_session=False)
+        db.session.execute(cls.__table__.insert().from_select(
+            ['created_at', 'updated_at', 'workspace_id', 'user_id', 'currency', 'due', 'paid'],
+            db.select([db.literal(now).label('created_at'), db.literal(now).label('updated_at'),
+                entries.c.workspace_id, entries.c.user_id, entries.c.currency,
+                db.func.sum(entries.c.due), db.func.sum(entries.c.paid)]).group_by(
+                entries.c.workspace_id, entries.c.user_id, entries.c.currency)))
+
+
+# --- Incremental updates -----------------------------------------------------
+
+@db.event.listens_for(ExpenseReport, 'after_update')
+def _report_updated(mapper, connection, target):
+    state = db.inspect(target)
+    attrs = ('status', 'workspace_id', 'user_id', 'currency')
+    if not any(state.attrs[attr].history.has_changes() for attr in attrs):
+        return
+    old = dict((attr, state.attrs[attr].history.deleted[0] if state.attrs[attr].history.deleted
+        else getattr(target, attr)) for attr in attrs)
+    new = dict((attr, getattr(target, attr)) for attr in attrs)
+    if old['status'] not in SETTLED_STATUSES and new['status'] not in SETTLED_STATUSES:
+        return
+    # The total may have been set with a SQL expression, so read what was saved
+    total = connection.scalar(db.select([ExpenseReport.__table__.c.total_value]).where(
+        ExpenseReport.__table__.c.id == target.id))
+    if old['status'] in SETTLED_STATUSES:
+        Balance.add(connection, old['workspace_id'], old['user_id'], old['currency'], due=-total)
+    if new['status'] in SETTLED_STATUSES:
+        Balance.add(connection, new['workspace_id'], new['user_id'], new['currency'], due=total)
+
+
+@db.event.listens_for(Payment, 'after_insert')
+def _payment_inserted(mapper, connection, target):
+    Balance.add(connection, target.workspace_id, target.user_id, target.currency, paid=target.amount)
+
+
+@db.event.listens_for(Payment, 'after_delete')
+def _payment_deleted(mapper, connection, target):
+    Balance.add(connection, target.workspace_id, target.user_id, target.currency, paid=-target.amount)
+
+
+@db.event.listens_for(Payment, 'after_update')
+def _payment_updated(mapper, connection, target):
+    state = db.inspect(target)
+    attrs = ('workspace_id', 'user_id', 'currency', 'amount')
+    if not any(state.attrs[attr].history.has_changes() for attr in attrs):
+        return
+    old = [state.attrs[attr].history.deleted[0] if state.attrs[attr].history.deleted
+        else getattr(target, attr) for attr in attrs]
+    Balance.add(connection, *old[:3], paid=-old[3])
+    Balance.add(connection, target.workspace_id, target.user_id, target.currency, paid=target.amount)
@@ -7,7 +7,9 @@ __all__ = ['User', 'Team']
 
 
 class User(UserBase, db.Model):
-    pass
+    #: Fingerprint of the organization data last synced to workspaces
+    #: (see :meth:`kharcha.models.Workspace.sync_from_user`)
+    sync_fingerprint = db.Column(db.Unicode(40), nullable=True)
 
 
 class Team(TeamBase, db.Model):
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 
+import json
+from hashlib import sha1
 from pytz import timezone
 from werkzeug.utils import cached_property
 from flask_lastuser.sqlalchemy import ProfileMixin
-from kharcha.models import db, BaseNameMixin, Team
+from kharcha.models import db, BaseNameMixin, User, Team
+from kharcha.permissions import cached_permissions
 
 __all__ = ['Workspace']
 
@@ -24,6 +27,18 @@ workspace_access_teams = db.Table('workspace_access_teams', db.Model.metadata,
     )
 
 
+def _in_teams(user, association, workspace_id):
+    """
+    SQL criterion for ``user`` being in any of the teams linked to the
+    workspace with ``workspace_id`` through ``association``.
+    """
+    users_teams = User.teams.property.secondary
+    return db.exists().where(db.and_(
+        association.c.workspace_id == workspace_id,
+        association.c.team_id == users_teams.c.team_id,
+        users_teams.c.user_id == user.id))
+
+
 class Workspace(ProfileMixin, BaseNameMixin, db.Model):
     """
     Workspaces contain expense reports, budgets and categories. Workspaces
@@ -56,6 +71,101 @@ class Workspace(ProfileMixin, BaseNameMixin, db.Model):
     def owners(self):
         return Team.query.filter_by(orgid=self.userid, owners=True).first()
 
+    @classmethod
+    def sync_fingerprint(cls, user):
+        """
+        Fingerprint of the user's details and organization and team
+        memberships, as received from Lastuser.
+        """
+        data = {
+            'user': [user.userid, user.username, user.fullname],
+            'organizations': sorted([org['userid'], org['name'], org['title']]
+                for org in user.organizations_memberof()),
+            'owned': sorted(user.organizations_owned_ids()),
+            'teams': sorted(team.userid for team in user.teams),
+            }
+        return sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def sync_organizations(cls, user):
+        """
+        Set the names and titles of workspaces to those of the user's
+        organizations, with one query to find the workspaces that differ and
+        two UPDATE statements for all of them. Workspaces are only made from
+        the new workspace page, not here.
+        """
+        orgs = dict((org['userid'], (org['name'], org['title'])) for org in user.organizations_memberof())
+        if not orgs:
+            return
+        names = dict((userid, name) for userid, (name, title) in orgs.items())
+        titles = dict((userid, title) for userid, (name, title) in orgs.items())
+        owners = dict((name, userid) for userid, name in names.items())
+        # Names are unique, so first move workspaces of other organizations
+        # out of the way, to their userids, as flask-lastuser does
+        renamed = cls.query.filter(cls.name.in_(list(owners.keys())), cls.userid != db.case(owners, value=cls.name))
+        name = db.case(names, value=cls.userid)
+        title = db.case(titles, value=cls.userid)
+        changed = cls.query.filter(cls.userid.in_(list(orgs.keys())), db.or_(cls.name != name, cls.title != title))
+        ids = [row[0] for row in renamed.with_entities(cls.id).union(changed.with_entities(cls.id))]
+        if not ids:
+            return
+        renamed.update({'name': cls.userid}, synchronize_session=False)
+        changed.update({'name': name, 'title': title}, synchronize_session=False)
+        # Bulk updates don't run mapper events, so make the note that
+        # kharcha.views.index makes for changed workspaces, for their
+        # cached sidebars to be invalidated on commit
+        db.session.info.setdefault('kharcha_sidebar_scopes', set()).update(
+            ['workspaces'] + ['workspace/%d' % workspace_id for workspace_id in ids])
+
+    @classmethod
+    def sync_from_user(cls, user):
+        """
+        Update workspace names and titles from the user's organizations, but
+        only if the user's data from Lastuser has changed since the last
+        sync. Returns True if a sync was needed.
+        """
+        fingerprint = cls.sync_fingerprint(user)
+        if fingerprint == user.sync_fingerprint:
+            return False
+        cls.sync_organizations(user)
+        user.sync_fingerprint = fingerprint
+        return True
+
+    def reviewers(self):
+        """
+        Query for users in this workspace's review teams.
+        """
+        return User.query.filter(User.teams.any(Team.id.in_([team.id for team in self.review_teams])))
+
+    @classmethod
+    def role_filter(cls, user, roles, workspace_id=None):
+        """
+        SQL criterion for ``user`` having any of ``roles`` (``admin``,
+        ``review`` and ``access``, as granted in :meth:`permissions`) in the
+        workspace whose id is ``workspace_id``, a column defaulting to
+        :attr:`id`. Use this to filter listings in the database instead of
+        checking permissions one object at a time.
+        """
+        if workspace_id is None:
+            workspace_id = cls.id
+        if user is None:
+            return db.false()
+        clauses = []
+        if 'admin' in roles:
+            clauses.append(_in_teams(user, workspace_admin_teams, workspace_id))
+            owned = user.organizations_owned_ids()
+            if owned:
+                # Organization owners are always admins
+                workspace = cls.__table__.alias()
+                clauses.append(workspace_id.in_(db.select([workspace.c.id]).where(
+                    workspace.c.userid.in_(owned))))
+        if 'review' in roles:
+            clauses.append(_in_teams(user, workspace_review_teams, workspace_id))
+        if 'access' in roles:
+            clauses.append(_in_teams(user, workspace_access_teams, workspace_id))
+        return db.or_(*clauses) if clauses else db.false()
+
+    @cached_permissions()
     def permissions(self, user, inherited=None):
         perms = super(Workspace, self).permissions(user, inherited)
         # No access without explicit tests
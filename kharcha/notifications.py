@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""
+Notification dispatcher
+=======================
+
+Workflow transitions write :class:`~kharcha.models.NotificationEvent` rows
+to an outbox in the same transaction as the transition. This module, run
+by ``manage.py sendnotifications``, reads unsent events in batches and
+mails each recipient a single digest. Repeated events for the same report
+(such as a report submitted, returned and resubmitted before the digest
+goes out) are reduced to the latest.
+
+Mail goes to the SMTP server in ``MAIL_SERVER`` and ``MAIL_PORT``. To try
+this locally, run a debugging SMTP server that prints messages instead of
+delivering them, and point ``MAIL_PORT`` at it::
+
+    python -m aiosmtpd -n -l localhost:1025
+"""
+
+import time
+import smtplib
+from collections import OrderedDict
+from datetime import datetime
+from email.header import Header
+from email.mime.text import MIMEText
+from email.utils import formataddr
+from flask import url_for
+
+from kharcha import app
+from kharcha.models import db, ExpenseReport, NotificationEvent
+
+__all__ = ['EVENT_MESSAGES', 'dispatch', 'run_dispatcher']
+
+#: Digest line for each event
+EVENT_MESSAGES = {
+    'submit': u"%(actor)s submitted “%(title)s” for review",
+    'resubmit': u"%(actor)s resubmitted “%(title)s” for review",
+    'accept': u"%(actor)s accepted your report “%(title)s”",
+    'return_for_review': u"%(actor)s returned your report “%(title)s” for review",
+    'reject': u"%(actor)s rejected your report “%(title)s”",
+    'close': u"%(actor)s marked your report “%(title)s” as reimbursed",
+    }
+
+
+def mail_sender():
+    sender = app.config.get('DEFAULT_MAIL_SENDER')
+    if isinstance(sender, (list, tuple)):
+        return formataddr(tuple(sender))
+    return sender
+
+
+def smtp_connection():
+    config = app.config
+    cls = smtplib.SMTP_SSL if config.get('MAIL_USE_SSL') else smtplib.SMTP
+    smtp = cls(config.get('MAIL_SERVER', 'localhost'), config.get('MAIL_PORT', 25))
+    if config.get('MAIL_USE_TLS'):
+        smtp.starttls()
+    if config.get('MAIL_USERNAME'):
+        smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+    return smtp
+
+
+def _close(smtp):
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, IOError):
+        # The connection is already broken
+        smtp.close()
+
+
+def digest(recipient, events):
+    """
+    Make a mail message for ``events``, all for ``recipient``, keeping only
+    the latest event for each report.
+    """
+    latest = OrderedDict()
+    for event in sorted(events, key=lambda e: e.id):
+        latest.pop(event.report_id, None)
+        latest[event.report_id] = event
+    lines = []
+    for event in latest.values():
+        report = event.report
+        lines.append(EVENT_MESSAGES.get(event.event, u"%(actor)s updated “%(title)s”") % {
+            'actor': event.actor.fullname if event.actor else u"Someone",
+            'title': report.title})
+        lines.append(u"  " + url_for('report', workspace=report.workspace.name, report=report.url_name,
+            _external=True))
+        lines.append(u"")
+    if len(latest) == 1:
+        subject = lines[0]
+    else:
+        subject = u"%d updates on expense reports" % len(latest)
+    message = MIMEText(u"\n".join(lines), 'plain', 'utf-8')
+    message['Subject'] = Header(subject, 'utf-8')
+    message['From'] = mail_sender()
+    message['To'] = formataddr((recipient.fullname, recipient.email))
+    return message
+
+
+def dispatch(batch=500):
+    """
+    Mail digests for up to ``batch`` unsent events. Events are marked sent
+    per recipient as each digest is accepted by the mail server; a failure
+    leaves that recipient's events for the next run. Returns the number of
+    events marked sent.
+    """
+    # Related rows are loaded with separate queries, keeping joins out of the
+    # locking query
+    events = NotificationEvent.query.filter(NotificationEvent.sent_at == None).order_by(  # NOQA
+        NotificationEvent.id).limit(batch).with_for_update(skip_locked=True).options(
+        db.selectinload(NotificationEvent.report).joinedload(ExpenseReport.workspace),
+        db.selectinload(NotificationEvent.actor), db.selectinload(NotificationEvent.recipient)).all()
+    if not events:
+        db.session.commit()
+        return 0
+
+    byrecipient = OrderedDict()
+    for event in events:
+        byrecipient.setdefault(event.recipient, []).append(event)
+
+    smtp = None
+    sent = 0
+    try:
+        for recipient, recipient_events in byrecipient.items():
+            if recipient.email:
+                message = digest(recipient, recipient_events)
+                try:
+                    if smtp is None:
+                        smtp = smtp_connection()
+                    smtp.sendmail(mail_sender(), [recipient.email], message.as_string())
+                except smtplib.SMTPRecipientsRefused as e:
+                    # Retrying won't help
+                    app.logger.warning("Mail server refused %s: %s", recipient.email, e)
+                except (smtplib.SMTPException, IOError) as e:
+                    app.logger.warning("Could not mail notifications to %s: %s", recipient.email, e)
+                    if smtp is not None:
+                        _close(smtp)
+                        smtp = None
+                    continue
+            # Users without an email address can't be notified; don't retry
+            now = datetime.utcnow()
+            for event in recipient_events:
+                event.sent_at = now
+            sent += len(recipient_events)
+    finally:
+        db.session.commit()
+        if smtp is not None:
+            _close(smtp)
+    return sent
+
+
+def run_dispatcher(poll=30, once=False):
+    """
+    Send notifications until interrupted, or until none are left if
+    ``once`` is set. Links in messages use the ``SERVER_NAME`` and
+    ``PREFERRED_URL_SCHEME`` settings.
+    """
+    with app.app_context():
+        while True:
+            if dispatch():
+                # There may be more
+                continue
+            if once:
+                break
+            time.sleep(poll)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-request permission cache
+============================
+
+Permissions are evaluated several times while handling a single request:
+once by :func:`coaster.views.load_models` for each model in the URL, and
+again by :class:`~kharcha.docflow.DocumentWorkflow` for every transition
+it checks. The cache here lives on :data:`flask.g`, so all of these share
+one result per actor and document, and nothing outlives the request.
+"""
+
+from functools import wraps
+from flask import g, has_app_context
+
+__all__ = ['request_cache', 'cached_permissions']
+
+
+def request_cache(name):
+    """
+    Return a dictionary named ``name`` that lasts for the current request,
+    or None when there is no request.
+    """
+    if not has_app_context():
+        return None
+    attr = '_kharcha_cache_' + name
+    cache = getattr(g, attr, None)
+    if cache is None:
+        cache = {}
+        setattr(g, attr, cache)
+    return cache
+
+
+def cached_permissions(*attrs):
+    """
+    Decorator for ``permissions(user, inherited)`` methods on models. The
+    result is remembered for the rest of the request, keyed by document,
+    actor and inherited permissions. Names in ``attrs`` are attributes whose
+    value the permissions depend on (such as a workflow state), and are
+    included in the key so that a change in the middle of a request is seen.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(self, user, inherited=None):
+            cache = request_cache('permissions')
+            if cache is None or self.id is None:
+                return f(self, user, inherited)
+            key = (self.__class__.__name__, self.id, getattr(user, 'id', None),
+                frozenset(inherited or ())) + tuple(getattr(self, attr) for attr in attrs)
+            perms = cache.get(key)
+            if perms is None:
+                perms = cache[key] = frozenset(f(self, user, inherited))
+            # Callers are free to modify the set they receive
+            return set(perms)
+        return wrapper
+    return decorator
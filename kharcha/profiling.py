@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+"""
+On-demand request profiling
+===========================
+
+Profiles a single request, for finding out where the time and memory go
+in a slow page. Profiling is enabled only when ``PROFILE_ADMINS`` lists
+the Lastuser userids of users allowed to use it; otherwise no hooks are
+installed and requests pay nothing.
+
+A request is profiled when it carries a token made by ``python manage.py
+profiletoken <userid>``, either in an ``X-Profile-Token`` header or a
+``_profile`` query parameter, and the logged in user is the one the token
+was made for. While the request runs:
+
+* a sampling thread records the stack of the request's thread every
+  ``PROFILE_INTERVAL`` seconds, saved in the collapsed stack format read by
+  ``flamegraph.pl`` and speedscope;
+* :mod:`tracemalloc` traces allocations, saved as a snapshot and as a
+  summary of the lines that allocated the most memory still in use at the
+  end of the request.
+
+Results are saved in ``PROFILE_FOLDER`` and the response names them in an
+``X-Profile`` header; see the ``profile_download`` view. Allocation tracing
+covers the whole process, so only one request is profiled at a time.
+"""
+
+import os
+import sys
+import threading
+from datetime import datetime
+from uuid import uuid4
+from collections import Counter
+from flask import g, request, url_for, current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+__all__ = ['KINDS', 'profile_serializer', 'profile_folder', 'is_profile_admin', 'init_app']
+
+#: Files saved for each profile, by name and file name suffix
+KINDS = {
+    'stacks': '.stacks.txt',
+    'memory': '.memory.txt',
+    'snapshot': '.tracemalloc',
+    }
+
+#: Allocation sites listed in the memory summary
+MEMORY_TOP = 50
+
+_profiling = threading.Lock()
+
+
+def profile_serializer(app=None):
+    app = app or current_app
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='kharcha-profile')
+
+
+def profile_folder():
+    return current_app.config.get('PROFILE_FOLDER') or os.path.join(current_app.instance_path, 'profiles')
+
+
+def is_profile_admin(user):
+    return user is not None and user.userid in current_app.config.get('PROFILE_ADMINS', ())
+
+
+class Sampler(threading.Thread):
+    """
+    Thread that counts the stacks seen in another thread at regular
+    intervals.
+    """
+    def __init__(self, thread_id, interval):
+        super(Sampler, self).__init__(name='profile-sampler')
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_sampling = threading.Event()
+
+    def run(self):
+        while not self._stop_sampling.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_sampling.set()
+        self.join()
+
+
+def _requested_token():
+    return request.headers.get('X-Profile-Token') or request.args.get('_profile')
+
+
+def _start_profile():
+    token = _requested_token()
+    if not token or not is_profile_admin(getattr(g, 'user', None)):
+        return
+    try:
+        userid = profile_serializer().loads(token, max_age=current_app.config.get('PROFILE_TOKEN_MAX_AGE', 86400))
+    except BadSignature:
+        return
+    if userid != g.user.userid or not _profiling.acquire(False):
+        return
+    if tracemalloc is not None:
+        tracemalloc.start(current_app.config.get('PROFILE_TRACEBACK_DEPTH', 25))
+    sampler = Sampler(threading.current_thread().ident, current_app.config.get('PROFILE_INTERVAL', 0.005))
+    sampler.start()
+    g._kharcha_profile = sampler
+
+
+def _save(profile_id, sampler, snapshot, peak):
+    folder = profile_folder()
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    path = os.path.join(folder, profile_id)
+    with open(path + KINDS['stacks'], 'w') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write('%s %d\n' % (stack, count))
+    if snapshot is not None:
+        snapshot.dump(path + KINDS['snapshot'])
+        stats = snapshot.statistics('traceback')
+        with open(path + KINDS['memory'], 'w') as f:
+            f.write('%s %s\nPeak traced memory: %d KiB\n'
+                '%d KiB allocated and still in use at the end, by allocation site\n\n' % (
+                request.method, request.path, peak // 1024, sum(stat.size for stat in stats) // 1024))
+            for stat in stats[:MEMORY_TOP]:
+                f.write('%d KiB in %d blocks\n' % (stat.size // 1024, stat.count))
+                for line in stat.traceback.format():
+                    f.write(line + '\n')
+                f.write('\n')
+
+
+def _finish_profile(response):
+    sampler = getattr(g, '_kharcha_profile', None)
+    if sampler is None:
+        return response
+    g._kharcha_profile = None
+    try:
+        sampler.stop()
+        snapshot = None
+        peak = 0
+        if tracemalloc is not None:
+            peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)])
+            tracemalloc.stop()
+        profile_id = '%s-%s' % (datetime.utcnow().strftime('%Y%m%dT%H%M%S'), uuid4().hex[:8])
+        _save(profile_id, sampler, snapshot, peak)
+    finally:
+        _profiling.release()
+    response.headers['X-Profile'] = url_for('profile_download', profile=profile_id, kind='stacks',
+        _external=True)
+    return response
+
+
+def _abandon_profile(exc):
+    # The request failed before after_request handlers ran
+    sampler = getattr(g, '_kharcha_profile', None)
+    if sampler is not None:
+        g._kharcha_profile = None
+        sampler.stop()
+        if tracemalloc is not None:
+            tracemalloc.stop()
+        _profiling.release()
+
+
+def init_app(app):
+    """
+    Install the profiling hooks, if enabled. Call after Lastuser is set up,
+    as the hooks need to know who is logged in.
+    """
+    if not app.config.get('PROFILE_ADMINS'):
+        return
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_abandon_profile)
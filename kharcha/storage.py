@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed file storage
+==============================
+
+Uploaded files are stored under ``UPLOAD_FOLDER`` by the SHA-256 hash of
+their contents, in a two-level directory tree (``ab/cd/abcd...``) so no
+single directory grows too large. Identical files share one copy on disk.
+
+Files are copied in chunks to a temporary file while being hashed, then
+renamed into place. A rename is atomic, so a file at its final path is
+always complete, and two uploads of the same content at the same time
+simply replace one complete copy with another.
+"""
+
+import os
+import errno
+import hashlib
+from tempfile import NamedTemporaryFile
+from kharcha import app
+
+__all__ = ['CHUNK_SIZE', 'DERIVATIVES', 'upload_folder', 'stored_path', 'store_stream', 'move_into_place']
+
+#: Bytes read from an upload at a time
+CHUNK_SIZE = 64 * 1024
+
+#: Files made from stored files, by name and suffix of the stored file name
+DERIVATIVES = {
+    'thumbnail': '.thumbnail.jpg',
+    'preview': '.preview.jpg',
+    }
+
+
+def upload_folder():
+    return app.config.get('UPLOAD_FOLDER') or os.path.join(app.instance_path, 'uploads')
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def stored_path(hash, suffix=''):
+    """
+    Path of the stored file with the given hash. ``suffix`` names files
+    derived from it, such as thumbnails.
+    """
+    return os.path.join(upload_folder(), hash[0:2], hash[2:4], hash + suffix)
+
+
+def store_stream(stream):
+    """
+    Copy a file-like object into storage. Returns the hash of its contents
+    and its size in bytes.
+    """
+    tmpdir = os.path.join(upload_folder(), 'tmp')
+    _makedirs(tmpdir)
+    digest = hashlib.sha256()
+    size = 0
+    with NamedTemporaryFile(dir=tmpdir, delete=False) as tmp:
+        try:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                tmp.write(chunk)
+        except:
+            os.remove(tmp.name)
+            raise
+    hash = digest.hexdigest()
+    path = stored_path(hash)
+    if os.path.exists(path):
+        os.remove(tmp.name)
+    else:
+        move_into_place(tmp.name, path)
+    return hash, size
+
+
+def move_into_place(tmpname, path):
+    """
+    Atomically move a complete temporary file to its final path.
+    """
+    _makedirs(os.path.dirname(path))
+    os.chmod(tmpname, 0o644)
+    os.rename(tmpname, path)
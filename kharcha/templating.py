@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""
+Template compilation at startup
+===============================
+
+Jinja compiles each template to Python code the first time it is used, in
+every process. Two settings move this cost out of the first requests that
+a freshly started worker handles:
+
+* ``TEMPLATE_CACHE_FOLDER`` keeps compiled templates on disk (default:
+  ``instance/template-cache``; set to False to disable), so each process
+  loads bytecode instead of compiling. Entries are keyed by the template's
+  source, so an edited template is never served stale.
+* ``PREWARM_TEMPLATES`` loads every template when the app is imported.
+  Under a server that loads the app before forking workers (gunicorn's
+  ``--preload``, uWSGI without ``lazy-apps``), workers start with all
+  templates already compiled.
+
+``python -m benchmarks.startup`` measures the effect of both.
+"""
+
+import os
+import errno
+from jinja2 import FileSystemBytecodeCache, TemplateError
+
+__all__ = ['prewarm_templates', 'init_app']
+
+#: Template file extensions loaded by :func:`prewarm_templates`
+TEMPLATE_EXTENSIONS = ('.html', '.jinja2', '.txt', '.xml')
+
+
+def prewarm_templates(app):
+    """
+    Load and compile every template the app can find, including those of
+    blueprints such as Baseframe's. Returns the number loaded.
+    """
+    env = app.jinja_env
+    names = env.list_templates(filter_func=lambda name: name.endswith(TEMPLATE_EXTENSIONS))
+    # Keep all of them in the environment's in-memory cache
+    if env.cache is not None and getattr(env.cache, 'capacity', len(names)) < len(names):
+        env.cache.capacity = len(names)
+    loaded = 0
+    for name in names:
+        try:
+            env.get_template(name)
+        except TemplateError as e:
+            app.logger.warning("Could not compile template %s: %s", name, e)
+        else:
+            loaded += 1
+    return loaded
+
+
+def init_app(app):
+    folder = app.config.get('TEMPLATE_CACHE_FOLDER')
+    if folder is None:
+        folder = os.path.join(app.instance_path, 'template-cache')
+    if folder:
+        try:
+            os.makedirs(folder)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                app.logger.warning("Not caching compiled templates: %s", e)
+                folder = None
+    if folder:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(folder)
+    if app.config.get('PREWARM_TEMPLATES'):
+        prewarm_templates(app)
@@ -7,3 +7,6 @@ import kharcha.views.setup
 import kharcha.views.expenses
 import kharcha.views.receipts
 import kharcha.views.settlements
+import kharcha.views.summaries
+import kharcha.views.search
+import kharcha.views.profiles
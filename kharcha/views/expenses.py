@@ -6,17 +6,24 @@ Manage expense reports
 
 import csv
 import io
-from flask import g, flash, url_for, render_template, request, redirect, Response
+from time import time
+from hashlib import sha1
+from datetime import datetime
+from flask import (g, flash, url_for, render_template, request, session, redirect, abort, jsonify, Response,
+    stream_with_context)
 from werkzeug.datastructures import MultiDict
 from coaster.utils import format_currency as coaster_format_currency
 from coaster.views import load_model, load_models
 from baseframe import request_is_xhr
 from baseframe.forms import render_form, render_redirect, render_delete_sqla, ConfirmDeleteForm
 
-from kharcha import app, lastuser
-from kharcha.forms import ExpenseReportForm, ExpenseForm
+from kharcha import app, lastuser, __version__
+from kharcha.forms import ExpenseReportForm, ExpenseForm, WorkflowForm
+from kharcha.forms.expenses import sorted_categories
 from kharcha.views.workflows import ExpenseReportWorkflow
-from kharcha.models import db, Workspace, ExpenseReport, Expense, Budget
+from kharcha.views.index import sidebar_version
+from kharcha.models import (db, SEQ_GAP, User, Workspace, ExpenseReport, Expense, Budget, Category, Receipt,
+    report_rows)
 
 
 @app.template_filter('format_currency')
@@ -28,12 +35,9 @@ def available_reports(workspace, user=None, all=False):
     if user is None:
         user = g.user
     query = ExpenseReport.query.filter_by(workspace=workspace).order_by(ExpenseReport.datetime)
-    # FIXME+TODO: Replace with per-workspace permissions
-    if all and 'review' in g.permissions:
-        # Get all reports owned by this user and in states where the user can review them
-        query = query.filter(db.or_(
-            ExpenseReport.user == user,
-            ExpenseReport.status.in_(ExpenseReportWorkflow.reviewable.values)))
+    if all:
+        # Every report this user can view
+        query = query.filter(ExpenseReport.visible_to(user))
     else:
         query = query.filter_by(user=user)
     return query
@@ -47,31 +51,196 @@ def available_reports(workspace, user=None, all=False):
     permission='view'
     )
 def budget(workspace, budget):
-    unsorted_reports = available_reports(workspace).filter_by(budget=budget).all()
-    if unsorted_reports:
+    rows = report_rows(available_reports(workspace).filter_by(budget=budget))
+    if rows:
         noreports = False
     else:
         noreports = True
-    reports = ExpenseReportWorkflow.sort_documents(unsorted_reports)
-    return render_template('budget.html.jinja2', budget=budget, reports=reports, noreports=noreports)
+    reports = dict((s.name, [r for r in rows if r.status == s.value]) for s in ExpenseReportWorkflow.states())
+    # Reports may be in different currencies, so totals use the converted
+    # values. Reports without an exchange rate are left out and counted
+    totals = {}
+    unconverted = {}
+    for status, total, missing in available_reports(workspace).filter_by(budget=budget).order_by(None).with_entities(
+            ExpenseReport.status, db.func.coalesce(db.func.sum(ExpenseReport.total_converted), 0),
+            db.func.count(ExpenseReport.id) - db.func.count(ExpenseReport.total_converted)).group_by(
+            ExpenseReport.status):
+        totals[status] = total
+        unconverted[status] = missing
+    totals = dict((s.name, totals.get(s.value)) for s in ExpenseReportWorkflow.states())
+    unconverted = dict((s.name, unconverted.get(s.value, 0)) for s in ExpenseReportWorkflow.states())
+    return render_template('budget.html.jinja2', budget=budget, reports=reports, totals=totals,
+        unconverted=unconverted, noreports=noreports)
+
+
+def encode_cursor(report):
+    """
+    Return an opaque cursor pointing just past the given report in a listing
+    sorted by ``(datetime, id)``, newest first.
+    """
+    return '%s.%d' % (report.datetime.strftime('%Y%m%d%H%M%S%f'), report.id)
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, report_id = cursor.split('.')
+        return datetime.strptime(timestamp, '%Y%m%d%H%M%S%f'), int(report_id)
+    except ValueError:
+        abort(400)
+
+
+def report_counts(query):
+    """
+    Count reports in the given query, grouped by workflow state name.
+    """
+    counts = dict(query.order_by(None).with_entities(
+        ExpenseReport.status, db.func.count(ExpenseReport.id)).group_by(ExpenseReport.status))
+    return dict((s.name, counts.get(s.value, 0)) for s in ExpenseReportWorkflow.states())
+
+
+def report_page(query, state, after=None):
+    """
+    Return one page of reports in the given workflow state, newest first, and
+    a cursor for the next page (None if this is the last page). Pages are
+    fetched with a keyset filter on ``(datetime, id)`` so that deep pages are
+    as cheap as the first one.
+    """
+    limit = app.config.get('REPORTS_PAGE_SIZE', 50)
+    query = query.filter(ExpenseReport.status == state.value).order_by(None).order_by(
+        ExpenseReport.datetime.desc(), ExpenseReport.id.desc())
+    if after:
+        timestamp, report_id = decode_cursor(after)
+        query = query.filter(db.or_(
+            ExpenseReport.datetime < timestamp,
+            db.and_(ExpenseReport.datetime == timestamp, ExpenseReport.id < report_id)))
+    reports = report_rows(query, limit=limit + 1)
+    if len(reports) > limit:
+        return reports[:limit], encode_cursor(reports[limit - 1])
+    return reports, None
+
+
+def render_reports(workspace, all=False):
+    query = available_reports(workspace, all=all)
+    counts = report_counts(query)
+    reports = {}
+    cursors = {}
+    for state in ExpenseReportWorkflow.states():
+        # Skip the query for states with no reports
+        if counts[state.name]:
+            reports[state.name], cursors[state.name] = report_page(query, state)
+        else:
+            reports[state.name], cursors[state.name] = [], None
+    return render_template('reports.html.jinja2', reports=reports, counts=counts, cursors=cursors, all=all)
 
 
 @app.route('/<workspace>/reports/')
 @lastuser.requires_login
 @load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission='view')
 def reports(workspace):
-    # Sort reports by status
-    reports = ExpenseReportWorkflow.sort_documents(available_reports(workspace).all())
-    return render_template('reports.html.jinja2', reports=reports)
+    return render_reports(workspace)
 
 
 @app.route('/<workspace>/reports/all')
 @lastuser.requires_login
 @load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission='view')
 def reports_all(workspace):
-    # Sort reports by status
-    reports = ExpenseReportWorkflow.sort_documents(available_reports(workspace, all=True).all())
-    return render_template('reports.html.jinja2', reports=reports)
+    return render_reports(workspace, all=True)
+
+
+@app.route('/<workspace>/reports/more')
+@lastuser.requires_login
+@load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission='view')
+def reports_more(workspace):
+    states = dict((s.name, s) for s in ExpenseReportWorkflow.states())
+    state = states.get(request.args.get('state'))
+    if state is None:
+        abort(404)
+    all = bool(request.args.get('all'))
+    reports, cursor = report_page(available_reports(workspace, all=all), state, request.args.get('after'))
+    return render_template('reportrows.html.jinja2', reports=reports, state=state, cursor=cursor, all=all)
+
+
+def stream_query(query):
+    """
+    Iterate over a query's rows through a server-side cursor, fetching them
+    in batches instead of loading the whole result.
+    """
+    return query.execution_options(stream_results=True).yield_per(app.config.get('CSV_BATCH_SIZE', 1000))
+
+
+def csv_stream(header, rows):
+    """
+    Encode rows as CSV, yielding the output in chunks as it is produced.
+    """
+    outfile = io.StringIO()
+    out = csv.writer(outfile)
+    out.writerow(header)
+    for row in rows:
+        out.writerow(row)
+        if outfile.tell() >= 16384:
+            yield outfile.getvalue()
+            outfile.seek(0)
+            outfile.truncate()
+    yield outfile.getvalue()
+
+
+def csv_response(header, rows, filename):
+    return Response(stream_with_context(csv_stream(header, rows)),
+        content_type='text/csv; charset=utf-8',
+        headers={'Content-Disposition': 'attachment; filename="%s.csv"' % filename,
+                 'Cache-Control': 'no-store',
+                 'Pragma': 'no-cache'})
+
+
+def date_arg(name):
+    value = request.args.get(name)
+    if value:
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            abort(400)
+
+
+@app.route('/<workspace>/reports/csv')
+@lastuser.requires_login
+@load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission='view')
+def reports_csv(workspace):
+    """
+    Export every expense in the reports visible to this user, optionally
+    limited by expense date (``from`` and ``to``), budget and report status.
+    """
+    query = available_reports(workspace, all=bool(request.args.get('all'))).order_by(None)
+    if request.args.get('budget'):
+        budget = Budget.query.filter_by(workspace=workspace, name=request.args['budget']).first_or_404()
+        query = query.filter(ExpenseReport.budget_id == budget.id)
+    if request.args.get('status'):
+        states = dict((s.name, s) for s in ExpenseReportWorkflow.states())
+        if request.args['status'] not in states:
+            abort(400)
+        query = query.filter(ExpenseReport.status == states[request.args['status']].value)
+    query = query.join(Expense, Expense.report_id == ExpenseReport.id).join(
+        Category, Expense.category_id == Category.id).join(
+        User, ExpenseReport.user_id == User.id).outerjoin(
+        Budget, ExpenseReport.budget_id == Budget.id)
+    start = date_arg('from')
+    if start:
+        query = query.filter(Expense.date >= start)
+    end = date_arg('to')
+    if end:
+        query = query.filter(Expense.date <= end)
+
+    lines = query.with_entities(
+        ExpenseReport.url_id, ExpenseReport.title, User.fullname, Budget.title, ExpenseReport.status,
+        ExpenseReport.currency, Expense.date, Category.title, Expense.description, Expense.amount).order_by(
+        ExpenseReport.datetime, ExpenseReport.id, Expense.seq)
+
+    titles = dict((s.value, s.title) for s in ExpenseReportWorkflow.states())
+    rows = ([url_id, title, owner, budget or '', titles[status], currency, date.isoformat(), category,
+            description, '%.2f' % amount]
+        for url_id, title, owner, budget, status, currency, date, category, description, amount
+        in stream_query(lines))
+    return csv_response(['Report', 'Title', 'Owner', 'Budget', 'Status', 'Currency', 'Date', 'Category',
+        'Description', 'Amount'], rows, '%s-expenses' % workspace.name)
 
 
 def report_edit_internal(workspace, form, report=None, workflow=None):
@@ -82,6 +251,8 @@ def report_edit_internal(workspace, form, report=None, workflow=None):
             db.session.add(report)
         form.populate_obj(report)
         report.make_name()
+        # The currency may have changed
+        report.update_converted()
         db.session.commit()
         return redirect(url_for('report', workspace=workspace.name, report=report.url_name), code=303)
     # TODO: Ajax handling here (but then again, is it required?)
@@ -89,6 +260,49 @@ def report_edit_internal(workspace, form, report=None, workflow=None):
         workspace=workspace, form=form, report=report, workflow=workflow)
 
 
+def report_validators(report):
+    """
+    ETag and last modified time for a page showing ``report``. Changes to
+    the report's expenses and receipts are read with one aggregate query.
+    The ETag also covers who is looking, their permissions, the sidebar and
+    the CSRF token embedded in forms.
+    """
+    expense_count, expense_updated, receipt_count, receipt_updated = db.session.query(
+        db.session.query(db.func.count(Expense.id)).filter(Expense.report_id == report.id).as_scalar(),
+        db.session.query(db.func.max(Expense.updated_at)).filter(Expense.report_id == report.id).as_scalar(),
+        db.session.query(db.func.count(Receipt.id)).filter(Receipt.report_id == report.id).as_scalar(),
+        db.session.query(db.func.max(Receipt.updated_at)).filter(Receipt.report_id == report.id).as_scalar(),
+        ).one()
+    last_modified = max(d for d in (report.updated_at, expense_updated, receipt_updated) if d is not None)
+    # Flask-WTF tokens are signed with a timestamp and expire, so pages
+    # can't be reused for longer than a fraction of their lifetime
+    csrf_period = int(time() * 2 // (app.config.get('WTF_CSRF_TIME_LIMIT') or 3600))
+    parts = [__version__, request.endpoint, report.id, report.updated_at.isoformat(), expense_count,
+        expense_updated and expense_updated.isoformat(), receipt_count, receipt_updated and receipt_updated.isoformat(),
+        g.user.id if g.user else None, ','.join(sorted(g.permissions)),
+        sidebar_version('workspace/%d' % report.workspace_id), sidebar_version('workspaces'),
+        session.get('csrf_token'), csrf_period]
+    return sha1(repr(parts).encode('utf-8')).hexdigest(), last_modified
+
+
+def report_response(report):
+    """
+    Start a response for a page showing ``report``. If the client's copy is
+    still current, the response is a 304 and the caller returns it without
+    rendering anything. Otherwise the caller sets its data.
+    """
+    response = app.response_class()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+        # Pending messages are shown (and removed) when the page is rendered
+        return response
+    etag, last_modified = report_validators(report)
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    return response.make_conditional(request)
+
+
 @app.route('/<workspace>/reports/new', methods=['GET', 'POST'])
 @lastuser.requires_login
 @load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission='new-report')
@@ -110,20 +324,17 @@ def report(workspace, report):
     expenseform.report = report
     if expenseform.validate_on_submit():
         if expenseform.id.data:
-            expense = Expense.query.get(expenseform.id.data)
+            expense = Expense.query.filter_by(report=report, id=expenseform.id.data).first_or_404()
+            previous = expense.amount
         else:
             expense = Expense()
-            # FIXME: Replace this with SQLAlchemy's sequence ordering extension
-
-            # Find the highest sequence number for expenses in this report.
-            # If None, assume 0, then add 1 to get the next sequence number
-            expense.seq = (db.session.query(
-                db.func.max(Expense.seq).label('seq')).filter_by(
-                    report_id=report.id).first().seq or 0) + 1
+            previous = 0
+            expense.seq = report.allocate_seq()
         expenseform.populate_obj(expense)
-        report.expenses.append(expense)
-        db.session.flush()
-        report.update_total()
+        # Assigning the report (rather than appending to report.expenses)
+        # avoids loading every other expense in the report
+        expense.report = report
+        report.adjust_total(expense.amount - previous)
         db.session.commit()
         if request_is_xhr():
             # Return with a blank form
@@ -132,11 +343,15 @@ def report(workspace, report):
             return redirect(url_for('report', workspace=workspace.name, report=report.url_name), code=303)
     if request_is_xhr():
         return render_template("expense.html.jinja2", report=report, expenseform=expenseform)
-    return render_template('report.html.jinja2',
+    response = report_response(report)
+    if response.status_code == 304:
+        return response
+    response.set_data(render_template('report.html.jinja2',
         report=report,
         workflow=workflow,
         transitions=workflow.transitions(),
-        expenseform=expenseform)
+        expenseform=expenseform))
+    return response
 
 
 @app.route('/<workspace>/reports/<report>/expensetable')
@@ -146,9 +361,129 @@ def report(workspace, report):
     permission='view'
     )
 def report_expensetable(workspace, report):
-    workflow = report.workflow()
-    return render_template('expensetable.html.jinja2',
-        report=report, workflow=workflow)
+    response = report_response(report)
+    if response.status_code == 304:
+        return response
+    response.set_data(render_template('expensetable.html.jinja2',
+        report=report, workflow=report.workflow()))
+    return response
+
+
+EXPENSE_FIELDS = ('date', 'category', 'description', 'amount')
+
+
+def expense_rows():
+    """
+    Line items posted to the batch endpoint, as a list of dicts. JSON bodies
+    have a list of objects under ``expenses``; form posts have fields named
+    ``expenses-<n>-<field>``, as made by a :class:`wtforms.fields.FieldList`.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('expenses'), list):
+            abort(400)
+        return [dict((field, row.get(field)) for field in EXPENSE_FIELDS)
+            for row in data['expenses'] if isinstance(row, dict)]
+    rows = {}
+    for key, value in request.form.items():
+        parts = key.split('-', 2)
+        if len(parts) == 3 and parts[0] == 'expenses' and parts[1].isdigit() and parts[2] in EXPENSE_FIELDS:
+            rows.setdefault(int(parts[1]), {})[parts[2]] = value
+    return [rows[index] for index in sorted(rows)]
+
+
+@app.route('/<workspace>/reports/<report>/expenses', methods=['POST'])
+@lastuser.requires_login
+@load_models(
+    (Workspace, {'name': 'workspace'}, 'g.workspace'),
+    (ExpenseReport, {'url_name': 'report', 'workspace': 'workspace'}, 'report'),
+    permission='new-expense'
+    )
+def report_expenses_add(workspace, report):
+    """
+    Add many expenses at once. All rows are validated first and nothing is
+    saved unless every row is valid. Categories may be given by id or name.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        csrf_token = request.headers.get('X-CSRFToken') or data.get('csrf_token')
+        form = WorkflowForm(MultiDict({'csrf_token': csrf_token}))
+    else:
+        form = WorkflowForm()
+    if not form.validate_on_submit():
+        abort(400)
+    rows = expense_rows()
+    if not rows or len(rows) > app.config.get('EXPENSE_BATCH_SIZE', 500):
+        abort(400)
+
+    # One query for the categories of every row
+    categories = sorted_categories().all()
+    category_ids = dict((c.name, u'%s' % c.id) for c in categories)
+    forms = []
+    errors = {}
+    for index, row in enumerate(rows):
+        row = dict((field, u'' if value is None else u'%s' % value) for field, value in row.items())
+        if row.get('category') in category_ids:
+            row['category'] = category_ids[row['category']]
+        expenseform = ExpenseForm(MultiDict(row), meta={'csrf': False})
+        expenseform.category.query = categories
+        if expenseform.validate():
+            forms.append(expenseform)
+        else:
+            errors[index] = expenseform.errors
+    if errors:
+        if request.is_json or request_is_xhr():
+            return jsonify(status='error', errors=errors), 400
+        index, rowerrors = min(errors.items())
+        return render_template('baseframe/message.html.jinja2', message="Row %d: %s" % (index + 1,
+            '; '.join('%s: %s' % (field, ', '.join(messages)) for field, messages in sorted(rowerrors.items())))), 400
+
+    seq = report.allocate_seq(len(forms))
+    total = 0
+    for expenseform in forms:
+        expense = Expense()
+        expenseform.populate_obj(expense)
+        expense.seq = seq
+        expense.report = report
+        seq += SEQ_GAP
+        total += expense.amount
+    report.adjust_total(total)
+    db.session.commit()
+    if request.is_json:
+        return jsonify(status='ok', count=len(forms), total=u'%s' % report.total_value)
+    if request_is_xhr():
+        return render_template('expensetable.html.jinja2', report=report, workflow=report.workflow())
+    return redirect(url_for('report', workspace=workspace.name, report=report.url_name), code=303)
+
+
+@app.route('/<workspace>/reports/<report>/reorder', methods=['POST'])
+@lastuser.requires_login
+@load_models(
+    (Workspace, {'name': 'workspace'}, 'g.workspace'),
+    (ExpenseReport, {'url_name': 'report', 'workspace': 'workspace'}, 'report'),
+    permission='edit'
+    )
+def report_reorder(workspace, report):
+    """
+    Reorder expenses. Expects every expense id in the report, in the new
+    order, as repeated ``expense`` form fields.
+    """
+    form = WorkflowForm()
+    if not form.validate_on_submit():
+        abort(400)
+    try:
+        ids = [int(expense_id) for expense_id in request.form.getlist('expense')]
+    except ValueError:
+        abort(400)
+    existing = set(expense_id for expense_id, in
+        db.session.query(Expense.id).filter(Expense.report_id == report.id))
+    if len(ids) != len(existing) or set(ids) != existing:
+        abort(400)
+    report.reorder_expenses(ids)
+    db.session.commit()
+    if request_is_xhr():
+        return render_template('expensetable.html.jinja2', report=report, workflow=report.workflow())
+    return redirect(url_for('report', workspace=workspace.name, report=report.url_name), code=303)
 
 
 @app.route('/<workspace>/reports/<report>/csv')
@@ -159,20 +494,12 @@ def report_expensetable(workspace, report):
     permission='view'
     )
 def report_csv(workspace, report):
-    outfile = io.StringIO()
-    out = csv.writer(outfile)
-    out.writerow(['Date', 'Category', 'Description', 'Amount'])
-    for expense in report.expenses:
-        out.writerow([expense.date.strftime('%Y-%m-%d'),
-                      expense.category.title.encode('utf-8'),
-                      expense.description.encode('utf-8'),
-                      '%.2f' % expense.amount])
-    response = Response(outfile.getvalue(),
-        content_type='text/csv; charset=utf-8',
-        headers={'Content-Disposition': 'attachment; filename="%s.csv"' % report.url_name,
-                 'Cache-Control': 'no-store',
-                 'Pragma': 'no-cache'})
-    return response
+    lines = db.session.query(Expense.date, Category.title, Expense.description, Expense.amount).join(
+        Category, Expense.category_id == Category.id).filter(
+        Expense.report_id == report.id).order_by(Expense.seq)
+    rows = ([date.isoformat(), category, description, '%.2f' % amount]
+        for date, category, description, amount in stream_query(lines))
+    return csv_response(['Date', 'Category', 'Description', 'Amount'], rows, report.url_name)
 
 
 @app.route('/<workspace>/reports/<report>/edit', methods=['GET', 'POST'])
@@ -226,9 +553,7 @@ def expense_delete(workspace, report, expense):
     if form.validate_on_submit():
         if 'delete' in request.form:
             db.session.delete(expense)
-            db.session.commit()
-            report.update_total()
-            report.update_sequence_numbers()
+            report.adjust_total(-expense.amount)
             db.session.commit()
         return redirect(url_for('report', workspace=workspace.name, report=report.url_name), code=303)
     return render_template('baseframe/delete.html.jinja2', form=form, title="Confirm delete",
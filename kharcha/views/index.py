@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 
+from collections import namedtuple
+from hashlib import sha1
+from uuid import uuid4
 from pytz import utc
 from flask import render_template, g
+from werkzeug.utils import cached_property
 from coaster.views import load_model
+from baseframe import cache
 from kharcha import app, lastuser
-from kharcha.models import Category, Budget, Workspace
+from kharcha.models import db, Category, Budget, Workspace
 from kharcha.views.workflows import ExpenseReportWorkflow
 
 
@@ -26,32 +31,122 @@ def longdate(date):
     return utc.localize(date).astimezone(tz).strftime('%e %B %Y')
 
 
-@app.context_processor
-def sidebarvars():
+#: Budgets, categories and workspaces as listed in the sidebar
+SidebarItem = namedtuple('SidebarItem', ['id', 'name', 'title'])
+
+
+class LazyList(object):
+    """
+    List that is only computed when a template first uses it, so that
+    templates without a sidebar don't pay for its queries.
+    """
+    def __init__(self, func):
+        self.func = func
+
+    @cached_property
+    def items(self):
+        return self.func()
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __bool__(self):
+        return bool(self.items)
+
+    __nonzero__ = __bool__
+
+
+def sidebar_version(scope):
+    """
+    Current version of the cached sidebar data for ``scope``. Cache keys
+    include this version, so invalidating a scope is a single delete.
+    """
+    key = 'kharcha/sidebar/version/' + scope
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        cache.set(key, version, timeout=0)
+    return version
+
+
+def invalidate_sidebar(scope):
+    cache.delete('kharcha/sidebar/version/' + scope)
+
+
+def sidebar_items(scope, name, model, query):
+    key = 'kharcha/sidebar/%s/%s/%s' % (scope, sidebar_version(scope), name)
+    items = cache.get(key)
+    if items is None:
+        items = [SidebarItem(*row) for row in
+            query.with_entities(model.id, model.name, model.title).order_by(model.title)]
+        cache.set(key, items, timeout=app.config.get('SIDEBAR_CACHE_TIMEOUT', 86400))
+    return items
+
+
+def sidebar_workspaces():
     if g.user:
         # TODO: Need more advanced access control
-        org_ids = g.user.organizations_memberof_ids()
+        org_ids = sorted(g.user.organizations_memberof_ids())
     else:
         org_ids = []
 
     if org_ids:
-        workspaces = Workspace.query.filter(Workspace.userid.in_(org_ids)).order_by(Workspace.title).all()
+        return sidebar_items('workspaces', sha1(' '.join(org_ids).encode('utf-8')).hexdigest(), Workspace,
+            Workspace.query.filter(Workspace.userid.in_(org_ids)))
     else:
-        workspaces = []
+        return []
 
+
+@app.context_processor
+def sidebarvars():
     if hasattr(g, 'workspace'):
+        scope = 'workspace/%d' % g.workspace.id
         return {
-            'workspaces': workspaces,
-            'categories': Category.query.filter_by(workspace=g.workspace).order_by(Category.title).all(),
-            'budgets': Budget.query.filter_by(workspace=g.workspace).order_by(Budget.title).all(),
+            'workspaces': LazyList(sidebar_workspaces),
+            'categories': LazyList(lambda: sidebar_items(scope, 'categories', Category,
+                Category.query.filter_by(workspace=g.workspace))),
+            'budgets': LazyList(lambda: sidebar_items(scope, 'budgets', Budget,
+                Budget.query.filter_by(workspace=g.workspace))),
             'report_states': ExpenseReportWorkflow.states(),
         }
     else:
         return {
-            'workspaces': workspaces,
+            'workspaces': LazyList(sidebar_workspaces),
         }
 
 
+def _invalidate_on_commit(target, *scopes):
+    # Invalidating before the commit would let a concurrent request cache
+    # the old data again, so just make a note here
+    db.object_session(target).info.setdefault('kharcha_sidebar_scopes', set()).update(scopes)
+
+
+def _workspace_sidebar_changed(mapper, connection, target):
+    _invalidate_on_commit(target, 'workspace/%d' % target.workspace_id)
+
+
+def _workspaces_sidebar_changed(mapper, connection, target):
+    _invalidate_on_commit(target, 'workspaces', 'workspace/%d' % target.id)
+
+
+for event in ('after_insert', 'after_update', 'after_delete'):
+    db.event.listen(Budget, event, _workspace_sidebar_changed)
+    db.event.listen(Category, event, _workspace_sidebar_changed)
+    db.event.listen(Workspace, event, _workspaces_sidebar_changed)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalidate_sidebars(session):
+    for scope in session.info.pop('kharcha_sidebar_scopes', ()):
+        invalidate_sidebar(scope)
+
+
 @app.route('/')
 def index():
     return render_template('index.html.jinja2')
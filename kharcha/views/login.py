@@ -23,16 +23,16 @@ def logout():
 @app.route('/login/redirect')
 @lastuser.auth_handler
 def lastuserauth():
-    Workspace.update_from_user(g.user, db.session, make_user_profiles=False, make_org_profiles=False)
-    db.session.commit()
+    if Workspace.sync_from_user(g.user):
+        db.session.commit()
     return redirect(get_next_url())
 
 
 @app.route('/login/notify', methods=['POST'])
 @lastuser.notification_handler
 def lastusernotify(user):
-    Workspace.update_from_user(user, db.session, make_user_profiles=False, make_org_profiles=False)
-    db.session.commit()
+    if Workspace.sync_from_user(user):
+        db.session.commit()
 
 
 @lastuser.auth_error_handler
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from flask import g, abort, send_from_directory
+
+from kharcha import app, lastuser
+from kharcha.profiling import KINDS, profile_folder, is_profile_admin
+
+
+@app.route('/_profiles/<profile>/<any(stacks, memory, snapshot):kind>')
+@lastuser.requires_login
+def profile_download(profile, kind):
+    if not is_profile_admin(g.user):
+        abort(403)
+    return send_from_directory(profile_folder(), profile + KINDS[kind],
+        mimetype='application/octet-stream' if kind == 'snapshot' else 'text/plain',
+        as_attachment=kind == 'snapshot')
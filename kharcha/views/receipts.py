@@ -1,10 +1,73 @@
 # -*- coding: utf-8 -*-
 
-from flask import render_template
-from coaster.views import load_model
+import os
+import unicodedata
+from flask import g, flash, url_for, render_template, redirect, abort, request
+from werkzeug.datastructures import Headers
+from werkzeug.urls import url_quote
+from werkzeug.wsgi import wrap_file
+from coaster.views import load_model, load_models
 
 from kharcha import app, lastuser
-from kharcha.models import Workspace
+from kharcha.forms import ReceiptForm
+from kharcha.models import db, Workspace, ExpenseReport, StoredFile, Receipt
+from kharcha.storage import DERIVATIVES, upload_folder, stored_path
+from kharcha.views.expenses import available_reports
+
+#: Types that are safe to show in the browser. Anything else the uploader
+#: claimed is downloaded as an attachment
+INLINE_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'application/pdf')
+
+
+def send_stored(path, mimetype, etag, filename=None, as_attachment=False):
+    """
+    Send a file from storage, supporting conditional and range requests.
+    Stored files never change, so ``etag`` (from the content hash) is a
+    strong validator.
+
+    When the front-end server is configured to serve storage directly (with
+    ``X_ACCEL_REDIRECT_PREFIX`` for nginx or ``USE_X_SENDFILE`` for Apache
+    and lighttpd), only headers are sent from here and the server transfers
+    the file and handles ranges. Otherwise the file is handed to the WSGI
+    server's file wrapper, which can use ``sendfile`` where supported.
+    """
+    headers = Headers()
+    headers['X-Content-Type-Options'] = 'nosniff'
+    if filename:
+        disposition = 'attachment' if as_attachment else 'inline'
+        try:
+            filename.encode('ascii')
+        except UnicodeEncodeError:
+            headers.add('Content-Disposition', disposition,
+                filename=unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii'),
+                **{'filename*': "UTF-8''%s" % url_quote(filename)})
+        else:
+            headers.add('Content-Disposition', disposition, filename=filename)
+    size = os.path.getsize(path)
+
+    accel_prefix = app.config.get('X_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        headers['X-Accel-Redirect'] = accel_prefix + os.path.relpath(path, upload_folder())
+    elif app.use_x_sendfile:
+        headers['X-Sendfile'] = path
+    offloaded = bool(accel_prefix or app.use_x_sendfile)
+    data = None if offloaded else wrap_file(request.environ, open(path, 'rb'))
+
+    response = app.response_class(data, mimetype=mimetype, headers=headers, direct_passthrough=True)
+    response.content_length = size
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config.get('RECEIPT_CACHE_TIMEOUT', 86400)
+    if offloaded:
+        # The front-end server applies ranges to the file it sends
+        response.accept_ranges = 'bytes'
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            response.headers.pop('X-Accel-Redirect', None)
+            response.headers.pop('X-Sendfile', None)
+    else:
+        response = response.make_conditional(request, accept_ranges=True, complete_length=size)
+    return response
 
 
 @app.route('/<workspace>/receipts')
@@ -12,11 +75,59 @@ from kharcha.models import Workspace
 @load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission='view')
 def receipts(workspace):
     # Gallery of receipts
-    return render_template('baseframe/message.html.jinja2', message="Coming soon")
+    receipts = Receipt.query.filter(Receipt.report_id.in_(
+        available_reports(workspace).with_entities(ExpenseReport.id).order_by(None))).options(
+        db.joinedload(Receipt.report), db.joinedload(Receipt.expense),
+        db.joinedload(Receipt.file).joinedload(StoredFile.job)).order_by(
+        Receipt.created_at.desc()).all()
+    return render_template('receipts.html.jinja2', receipts=receipts)
 
 
-@app.route('/<workspace>/receipts/new')
+@app.route('/<workspace>/receipts/new', methods=['GET', 'POST'])
 @lastuser.requires_login
 @load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission='view')
 def receipt_new(workspace):
-    return render_template('baseframe/message.html.jinja2', message="Coming soon")
+    form = ReceiptForm()
+    if form.validate_on_submit():
+        upload = form.file.data
+        # The upload is copied to storage in chunks, never read into memory whole
+        stored = StoredFile.store(upload.stream, upload.mimetype or u'application/octet-stream')
+        receipt = Receipt(report=form.report.data, expense=form.expense.data, user=g.user, file=stored,
+            filename=upload.filename[:250])
+        receipt.make_id()
+        db.session.commit()
+        flash("Your receipt has been uploaded", 'success')
+        return redirect(url_for('receipts', workspace=workspace.name), code=303)
+    return render_template('receiptnew.html.jinja2', form=form)
+
+
+@app.route('/<workspace>/reports/<report>/receipts/<int:receipt>/<any(thumbnail, preview):kind>')
+@lastuser.requires_login
+@load_models(
+    (Workspace, {'name': 'workspace'}, 'g.workspace'),
+    (ExpenseReport, {'url_name': 'report', 'workspace': 'workspace'}, 'report'),
+    (Receipt, {'url_id': 'receipt', 'report': 'report'}, 'receipt'),
+    permission='view'
+    )
+def receipt_derivative(workspace, report, receipt, kind):
+    # Derivatives are made by the receipt worker. Until then there is nothing
+    # to show; they are never made here
+    if not getattr(receipt.file, kind):
+        abort(404)
+    return send_stored(stored_path(receipt.file.hash, DERIVATIVES[kind]), 'image/jpeg',
+        receipt.file.hash + DERIVATIVES[kind])
+
+
+@app.route('/<workspace>/reports/<report>/receipts/<int:receipt>')
+@lastuser.requires_login
+@load_models(
+    (Workspace, {'name': 'workspace'}, 'g.workspace'),
+    (ExpenseReport, {'url_name': 'report', 'workspace': 'workspace'}, 'report'),
+    (Receipt, {'url_id': 'receipt', 'report': 'report'}, 'receipt'),
+    permission='view'
+    )
+def receipt(workspace, report, receipt):
+    stored = receipt.file
+    inline = stored.mimetype in INLINE_TYPES
+    return send_stored(stored.path, stored.mimetype if inline else 'application/octet-stream', stored.hash,
+        filename=receipt.filename, as_attachment=not inline)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+from flask import render_template, request, abort
+from coaster.views import load_model
+
+from kharcha import app, lastuser
+from kharcha.models import db, Workspace, ExpenseReport, Expense, report_rows, search_hits, matching_expenses
+from kharcha.views.expenses import available_reports
+
+
+@app.route('/<workspace>/search')
+@lastuser.requires_login
+@load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission='view')
+def search(workspace):
+    terms = request.args.get('q', u'').strip()
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        abort(400)
+    limit = app.config.get('SEARCH_PAGE_SIZE', 20)
+    results = []
+    expenses = {}
+    more = False
+    if terms:
+        # Reports are ranked by the combined rank of their own text and
+        # their matching expenses
+        hits = search_hits(terms, workspace.id).alias('hits')
+        scores = db.session.query(hits.c.report_id, db.func.sum(hits.c.rank).label('score')).group_by(
+            hits.c.report_id).subquery()
+        query = available_reports(workspace, all=True).join(scores, scores.c.report_id == ExpenseReport.id
+            ).order_by(None).order_by(scores.c.score.desc(), ExpenseReport.id.desc())
+        results = report_rows(query, limit=limit + 1, offset=(page - 1) * limit)
+        more = len(results) > limit
+        results = results[:limit]
+        if results:
+            for expense in matching_expenses(terms, [r.id for r in results]).options(
+                    db.joinedload(Expense.category)):
+                expenses.setdefault(expense.report_id, []).append(expense)
+    return render_template('search.html.jinja2', terms=terms, results=results, expenses=expenses, page=page,
+        more=more)
@@ -1,14 +1,39 @@
 # -*- coding: utf-8 -*-
 
-from flask import render_template
+from flask import g, flash, url_for, render_template
 from coaster.views import load_model
+from baseframe.forms import render_form, render_redirect
 
 from kharcha import app, lastuser
-from kharcha.models import Workspace
+from kharcha.forms import PaymentForm
+from kharcha.models import db, User, Workspace, Payment, Balance
 
 
 @app.route('/<workspace>/settlements/')
 @lastuser.requires_login
 @load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission='view')
 def settlements(workspace):
-    return render_template('baseframe/message.html.jinja2', message="Coming soon")
+    # Balances are maintained as reports are accepted and payments recorded,
+    # so this is one row per user and currency
+    query = Balance.query.filter_by(workspace=workspace).join(User).options(
+        db.contains_eager(Balance.user)).order_by(User.fullname, Balance.currency)
+    if 'review' not in g.permissions and 'admin' not in g.permissions:
+        query = query.filter(Balance.user == g.user)
+    return render_template('settlements.html.jinja2', balances=query.all())
+
+
+@app.route('/<workspace>/settlements/pay', methods=['GET', 'POST'])
+@lastuser.requires_login
+@load_model(Workspace, {'name': 'workspace'}, 'g.workspace', permission=('review', 'admin'))
+def payment_new(workspace):
+    form = PaymentForm()
+    if form.validate_on_submit():
+        payment = Payment(workspace=workspace)
+        form.populate_obj(payment)
+        db.session.add(payment)
+        db.session.commit()
+        flash("Recorded payment to %s." % payment.user.fullname, "success")
+        return render_redirect(url_for('settlements', workspace=workspace.name), code=303)
+    return render_form(form=form, title="Record a payment",
+        formid="payment_new", submit="Save",
+        cancel_url=url_for('settlements', workspace=workspace.name), ajax=False)
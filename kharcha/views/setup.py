@@ -17,8 +17,8 @@ from kharcha.forms import BudgetForm, CategoryForm, NewWorkspaceForm, WorkspaceF
 @lastuser.requires_login
 def workspace_new():
     # Step 1: Get a list of organizations this user owns
-    existing = Workspace.query.filter(Workspace.userid.in_(g.user.organizations_owned_ids())).all()
-    existing_ids = [e.userid for e in existing]
+    existing_ids = set(userid for userid, in
+        db.session.query(Workspace.userid).filter(Workspace.userid.in_(g.user.organizations_owned_ids())))
     # Step 2: Prune list to organizations without a workspace
     new_workspaces = []
     for org in g.user.organizations_owned():
@@ -30,10 +30,10 @@ def workspace_new():
             message=Markup("You do not have any organizations that do not already have a workspace. "
                 'Would you like to <a href="%s">create a new organization</a>?' %
                     lastuser.endpoint_url('/organizations/new')))
-    eligible_workspaces = []
-    for orgid, title in new_workspaces:
-        if Team.query.filter_by(orgid=orgid).first() is not None:
-            eligible_workspaces.append((orgid, title))
+    # Organizations that have shared their teams with this app
+    with_teams = set(orgid for orgid, in db.session.query(Team.orgid).filter(
+        Team.orgid.in_([orgid for orgid, title in new_workspaces])).distinct())
+    eligible_workspaces = [(orgid, title) for orgid, title in new_workspaces if orgid in with_teams]
     if not eligible_workspaces:
         return render_message(
             title="No organizations available",
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+Spend summaries for budgets and categories
+"""
+
+from collections import OrderedDict
+from flask import render_template
+from coaster.views import load_models
+
+from kharcha import app, lastuser
+from kharcha.views.workflows import ExpenseReportWorkflow
+from kharcha.models import db, REPORT_STATUS, Workspace, Budget, Category, SpendRollup
+
+
+def spend_summary(workspace, **filters):
+    """
+    Spend per month and currency with a column for each report state, read
+    from the rollups. Drafts are private to their owners and are left out.
+    """
+    states = [s for s in ExpenseReportWorkflow.states() if s.value != REPORT_STATUS.DRAFT]
+    rows = db.session.query(SpendRollup.month, SpendRollup.currency, SpendRollup.status,
+        db.func.sum(SpendRollup.amount), db.func.sum(SpendRollup.count)).filter_by(
+        workspace_id=workspace.id, **filters).filter(
+        SpendRollup.status != REPORT_STATUS.DRAFT).group_by(
+        SpendRollup.month, SpendRollup.currency, SpendRollup.status).order_by(
+        SpendRollup.month.desc(), SpendRollup.currency)
+    summary = OrderedDict()
+    for month, currency, status, amount, count in rows:
+        if count:
+            summary.setdefault((month, currency), {})[status] = amount
+    return states, summary
+
+
+@app.route('/<workspace>/budgets/<budget>/summary')
+@lastuser.requires_login
+@load_models(
+    (Workspace, {'name': 'workspace'}, 'g.workspace'),
+    (Budget, {'name': 'budget', 'workspace': 'workspace'}, 'budget'),
+    permission=('review', 'admin')
+    )
+def budget_summary(workspace, budget):
+    states, summary = spend_summary(workspace, budget_id=budget.id)
+    return render_template('summary.html.jinja2', title="Budget: %s" % budget.title,
+        budget=budget, states=states, summary=summary)
+
+
+@app.route('/<workspace>/categories/<category>/summary')
+@lastuser.requires_login
+@load_models(
+    (Workspace, {'name': 'workspace'}, 'g.workspace'),
+    (Category, {'name': 'category', 'workspace': 'workspace'}, 'category'),
+    permission=('review', 'admin')
+    )
+def category_summary(workspace, category):
+    states, summary = spend_summary(workspace, category_id=category.id)
+    return render_template('summary.html.jinja2', title="Category: %s" % category.title,
+        category=category, states=states, summary=summary)
@@ -5,7 +5,7 @@ from __future__ import absolute_import
 from datetime import datetime
 from flask import g
 from kharcha.docflow import DocumentWorkflow, WorkflowState, WorkflowStateGroup
-from kharcha.models import REPORT_STATUS, ExpenseReport
+from kharcha.models import db, REPORT_STATUS, ExpenseReport, NotificationEvent
 from kharcha.forms import ReviewForm
 
 
@@ -30,6 +30,17 @@ class ExpenseReportWorkflow(DocumentWorkflow):
     reviewable = WorkflowStateGroup([pending, review, accepted, rejected, closed],
                                     title="Reviewable")
 
+    def notify(self, event, recipients):
+        """
+        Queue a notification to each of ``recipients``, except the user
+        making the change. Notifications are mailed by a separate worker.
+        """
+        actor = g.user if g else None
+        for recipient in recipients:
+            if recipient != actor:
+                db.session.add(NotificationEvent(report=self.document, actor=actor, recipient=recipient,
+                    event=event))
+
     @draft.transition(pending, 'owner', title="Submit", category="primary",
         description="Submit this expense report to a reviewer? You cannot "
         "edit this report after it has been submitted.",
@@ -40,7 +51,9 @@ class ExpenseReportWorkflow(DocumentWorkflow):
         """
         # Update timestamp
         self.document.datetime = datetime.utcnow()
-        # TODO: Notify reviewers
+        # Convert at the rate on the date of submission
+        self.document.update_converted()
+        self.notify(u'submit', self.document.workspace.reviewers())
 
     @review.transition(pending, 'owner', title="Submit", category="primary",
         description="Resubmit this expense report to a reviewer? You cannot "
@@ -52,7 +65,9 @@ class ExpenseReportWorkflow(DocumentWorkflow):
         """
         # Update timestamp
         self.document.datetime = datetime.utcnow()
-        # TODO: Notify reviewers
+        # Convert at the rate on the date of submission
+        self.document.update_converted()
+        self.notify(u'resubmit', self.document.workspace.reviewers())
 
     @pending.transition(accepted, 'review', title="Accept", category="primary",
         description="Accept this expense report and queue it for reimbursements?",
@@ -61,8 +76,8 @@ class ExpenseReportWorkflow(DocumentWorkflow):
         """
         Accept the expense report and mark for payout to owner.
         """
-        # TODO: Notify owner of acceptance
         self.document.reviewer = reviewer
+        self.notify(u'accept', [self.document.user])
 
     @pending.transition(review, 'review', title="Return for review", category="warning",
         description="Return this expense report to the submitter for review?",
@@ -71,9 +86,9 @@ class ExpenseReportWorkflow(DocumentWorkflow):
         """
         Return report to owner for review.
         """
-        # TODO: Notify owner
         self.document.reviewer = reviewer
         self.document.notes = notes
+        self.notify(u'return_for_review', [self.document.user])
 
     @pending.transition(rejected, 'review', title="Reject", category="danger",
         description="Reject this expense report? Rejected reports are archived but cannot be processed again.",
@@ -82,9 +97,9 @@ class ExpenseReportWorkflow(DocumentWorkflow):
         """
         Reject expense report.
         """
-        # TODO: Notify owner
         self.document.reviewer = reviewer
         self.document.notes = notes
+        self.notify(u'reject', [self.document.user])
 
     @review.transition(withdrawn, 'owner', title="Withdraw", category="danger",
         description="Withdraw this expense report? Withdrawn reports are archived but cannot be processed again.",
@@ -103,8 +118,7 @@ class ExpenseReportWorkflow(DocumentWorkflow):
         """
         Close expense report (indicates reimbursement).
         """
-        # TODO: Notify owner of closure.
-        pass
+        self.notify(u'close', [self.document.user])
 
 # Apply this workflow on ExpenseReport objects
 ExpenseReportWorkflow.apply_on(ExpenseReport)
@@ -2,11 +2,136 @@
 
 from coaster.manage import init_manager
 
-from kharcha.models import db
+from kharcha.models import (db, User, Workspace, ExpenseReport, Expense, SpendRollup, Balance, ReportTransition,
+    REPORT_STATUS, load_exchange_rates)
 from kharcha import app
 
 
+def checkindexes():
+    """Check that the hot listing queries are planned with their indexes"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        # Small tables are cheaper to scan, which would hide a missing index
+        db.session.execute('SET LOCAL enable_seqscan = off')
+        explain = 'EXPLAIN '
+    elif dialect == 'sqlite':
+        explain = 'EXPLAIN QUERY PLAN '
+    else:
+        print("Don't know how to read query plans for %s" % dialect)
+        return
+
+    workspace = Workspace.query.first()
+    report = ExpenseReport.query.first()
+    if workspace is None or report is None:
+        print("Need at least one workspace and expense report to check")
+        return
+    newest_first = (ExpenseReport.datetime.desc(), ExpenseReport.id.desc())
+
+    checks = [
+        ("My reports", 'ix_expense_report_workspace_user_status_datetime', ExpenseReport.query.filter_by(
+            workspace_id=workspace.id, user_id=report.user_id, status=REPORT_STATUS.PENDING).order_by(
+            *newest_first).limit(50)),
+        ("All reports", 'ix_expense_report_workspace_status_datetime', ExpenseReport.query.filter_by(
+            workspace_id=workspace.id, status=REPORT_STATUS.PENDING).order_by(*newest_first).limit(50)),
+        ("Budget", 'ix_expense_report_budget_status_datetime', ExpenseReport.query.filter_by(
+            budget_id=report.budget_id or 0).order_by(ExpenseReport.status, ExpenseReport.datetime)),
+        ("Report expenses", 'ix_expense_report_seq', Expense.query.filter_by(
+            report_id=report.id).order_by(Expense.seq)),
+        ("Category expenses", 'ix_expense_category_date', Expense.query.filter_by(
+            category_id=0).order_by(Expense.date)),
+        ]
+
+    failed = False
+    for title, index, query in checks:
+        sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+        plan = '\n'.join(' '.join(str(column) for column in row) for row in db.session.execute(explain + sql))
+        if index in plan:
+            print("%s: uses %s" % (title, index))
+        else:
+            failed = True
+            print("%s: does NOT use %s\n%s" % (title, index, plan))
+    db.session.rollback()
+    if failed:
+        raise SystemExit(1)
+
+
+def loadrates(filename):
+    """Load exchange rates from a CSV file with date, currency and rate columns"""
+    with open(filename) as f:
+        count = load_exchange_rates(f)
+    db.session.commit()
+    print("Loaded %d rates" % count)
+
+
+def convertreports():
+    """Recompute converted totals of expense reports from exchange rates"""
+    for done in ExpenseReport.convert_totals():
+        db.session.commit()
+        print("Converted %d reports" % done)
+
+
+def rebuildbalances():
+    """Recompute settlement balances from accepted reports and payments"""
+    Balance.rebuild()
+    db.session.commit()
+
+
+def receiptworker(processes=2, once=False):
+    """Make thumbnails and previews of uploaded receipts"""
+    from kharcha.derivatives import run_worker
+    run_worker(processes=int(processes), once=once)
+
+
+def sendnotifications(once=False):
+    """Mail notifications about expense reports, as digests"""
+    from kharcha.notifications import run_dispatcher
+    run_dispatcher(once=once)
+
+
+def profiletoken(userid):
+    """Make a token for profiling requests, for a user listed in PROFILE_ADMINS"""
+    from kharcha.profiling import profile_serializer
+    if userid not in app.config.get('PROFILE_ADMINS', ()):
+        print("%s is not in PROFILE_ADMINS" % userid)
+        raise SystemExit(1)
+    print(profile_serializer(app).dumps(userid))
+
+
+def turnaround(workspace=None, status='pending', days=90):
+    """Show how long reports stayed in a status, by the user who moved them on (for pending, the reviewer)"""
+    from datetime import datetime, timedelta
+    value = getattr(REPORT_STATUS, status.upper(), None)
+    if value is None:
+        print("Unknown status %s" % status)
+        raise SystemExit(1)
+    workspace_id = None
+    if workspace:
+        workspace_id = Workspace.query.filter_by(name=workspace).one().id
+    rows = ReportTransition.time_in_status(value, workspace_id=workspace_id,
+        since=datetime.utcnow() - timedelta(days=int(days))).all()
+    users = dict((user.id, user) for user in User.query.filter(User.id.in_([row[0] for row in rows if row[0]])))
+    print("%-30s %8s %12s %12s" % ('User', 'Reports', 'Avg hours', 'Max hours'))
+    for user_id, count, average, longest in sorted(rows, key=lambda row: -row[2]):
+        name = users[user_id].fullname if user_id in users else '(unknown)'
+        print("%-30s %8d %12.1f %12.1f" % (name, count, average / 3600, longest / 3600))
+
+
+def rebuildrollups():
+    """Recompute spend rollups from expense line items"""
+    SpendRollup.rebuild()
+    db.session.commit()
+
+
 if __name__ == '__main__':
     db.init_app(app)
     manager = init_manager(app, db)
+    manager.command(checkindexes)
+    manager.command(loadrates)
+    manager.command(convertreports)
+    manager.command(rebuildrollups)
+    manager.command(rebuildbalances)
+    manager.command(receiptworker)
+    manager.command(sendnotifications)
+    manager.command(profiletoken)
+    manager.command(turnaround)
     manager.run()
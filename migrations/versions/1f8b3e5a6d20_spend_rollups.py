@@ -0,0 +1,55 @@
+"""Spend rollups
+
+Revision ID: 1f8b3e5a6d20
+Revises: 4a7d2f6c8e13
+Create Date: 2026-10-18 13:02:51.447810
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1f8b3e5a6d20'
+down_revision = '4a7d2f6c8e13'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('spend_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('workspace_id', sa.Integer(), nullable=False),
+    sa.Column('budget_id', sa.Integer(), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('status', sa.Integer(), nullable=False),
+    sa.Column('currency', sa.Unicode(length=3), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['budget_id'], ['budget.id'], ),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ),
+    sa.ForeignKeyConstraint(['workspace_id'], ['workspace.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_spend_rollup_key', 'spend_rollup',
+        ['workspace_id', sa.text('coalesce(budget_id, 0)'), 'category_id', 'month', 'status', 'currency'],
+        unique=True)
+    op.create_index('ix_spend_rollup_category_month', 'spend_rollup', ['category_id', 'month'])
+
+    if op.get_bind().dialect.name == 'postgresql':
+        month = "CAST(date_trunc('month', expense.date) AS DATE)"
+    else:
+        month = "date(expense.date, 'start of month')"
+    op.execute(sa.text('''
+        INSERT INTO spend_rollup (workspace_id, budget_id, category_id, month, status, currency, amount, count)
+        SELECT expense_report.workspace_id, expense_report.budget_id, expense.category_id, {month},
+            expense_report.status, expense_report.currency, SUM(expense.amount), COUNT(expense.id)
+        FROM expense_report JOIN expense ON expense.report_id = expense_report.id
+        GROUP BY expense_report.workspace_id, expense_report.budget_id, expense.category_id, {month},
+            expense_report.status, expense_report.currency
+        '''.format(month=month)))
+
+
+def downgrade():
+    op.drop_index('ix_spend_rollup_category_month', 'spend_rollup')
+    op.drop_index('ix_spend_rollup_key', 'spend_rollup')
+    op.drop_table('spend_rollup')
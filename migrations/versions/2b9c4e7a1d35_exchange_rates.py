@@ -0,0 +1,29 @@
+"""Exchange rates
+
+Revision ID: 2b9c4e7a1d35
+Revises: 1f8b3e5a6d20
+Create Date: 2026-10-18 14:10:36.218504
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2b9c4e7a1d35'
+down_revision = '1f8b3e5a6d20'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('exchange_rate',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('currency', sa.Unicode(length=3), nullable=False),
+    sa.Column('rate', sa.Numeric(precision=18, scale=8), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('currency', 'date')
+    )
+
+
+def downgrade():
+    op.drop_table('exchange_rate')
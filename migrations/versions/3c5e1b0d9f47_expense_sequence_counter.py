@@ -0,0 +1,27 @@
+"""Expense sequence counter
+
+Revision ID: 3c5e1b0d9f47
+Revises: 342f7d42966
+Create Date: 2026-10-18 10:12:04.318452
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c5e1b0d9f47'
+down_revision = '342f7d42966'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('expense_report', sa.Column('last_seq', sa.Integer(), nullable=False, server_default='0'))
+    op.alter_column('expense_report', 'last_seq', server_default=None)
+    op.execute(sa.text('''
+        UPDATE expense_report SET last_seq = COALESCE(
+            (SELECT MAX(expense.seq) FROM expense WHERE expense.report_id = expense_report.id), 0)
+        '''))
+
+
+def downgrade():
+    op.drop_column('expense_report', 'last_seq')
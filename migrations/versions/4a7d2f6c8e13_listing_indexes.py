@@ -0,0 +1,39 @@
+"""Listing indexes
+
+Revision ID: 4a7d2f6c8e13
+Revises: 3c5e1b0d9f47
+Create Date: 2026-10-18 11:40:27.905163
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4a7d2f6c8e13'
+down_revision = '3c5e1b0d9f47'
+
+from alembic import op
+
+
+indexes = [
+    ('ix_expense_report_workspace_status_datetime', 'expense_report',
+        ['workspace_id', 'status', 'datetime', 'id']),
+    ('ix_expense_report_workspace_user_status_datetime', 'expense_report',
+        ['workspace_id', 'user_id', 'status', 'datetime', 'id']),
+    ('ix_expense_report_budget_status_datetime', 'expense_report',
+        ['budget_id', 'status', 'datetime']),
+    ('ix_expense_report_seq', 'expense', ['report_id', 'seq']),
+    ('ix_expense_category_date', 'expense', ['category_id', 'date']),
+    ]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY does not block writes on PostgreSQL, but
+    # cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(indexes):
+            op.drop_index(name, table, postgresql_concurrently=True)
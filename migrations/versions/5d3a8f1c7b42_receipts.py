@@ -0,0 +1,49 @@
+"""Receipts
+
+Revision ID: 5d3a8f1c7b42
+Revises: 2b9c4e7a1d35
+Create Date: 2026-10-18 14:52:09.531876
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d3a8f1c7b42'
+down_revision = '2b9c4e7a1d35'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('stored_file',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('hash', sa.Unicode(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('mimetype', sa.Unicode(length=80), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('hash')
+    )
+    op.create_table('receipt',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('url_id', sa.Integer(), nullable=False),
+    sa.Column('report_id', sa.Integer(), nullable=False),
+    sa.Column('expense_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('file_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.Unicode(length=250), nullable=False),
+    sa.ForeignKeyConstraint(['expense_id'], ['expense.id'], ),
+    sa.ForeignKeyConstraint(['file_id'], ['stored_file.id'], ),
+    sa.ForeignKeyConstraint(['report_id'], ['expense_report.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('url_id', 'report_id')
+    )
+
+
+def downgrade():
+    op.drop_table('receipt')
+    op.drop_table('stored_file')
@@ -0,0 +1,46 @@
+"""Receipt derivatives
+
+Revision ID: 6e1f9b2d4a58
+Revises: 5d3a8f1c7b42
+Create Date: 2026-10-18 15:31:44.072614
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6e1f9b2d4a58'
+down_revision = '5d3a8f1c7b42'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('stored_file', sa.Column('thumbnail', sa.Boolean(), nullable=False,
+        server_default=sa.sql.expression.false()))
+    op.add_column('stored_file', sa.Column('preview', sa.Boolean(), nullable=False,
+        server_default=sa.sql.expression.false()))
+    op.create_table('derivative_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('file_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('claimed_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['file_id'], ['stored_file.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('file_id')
+    )
+    op.create_index('ix_derivative_job_status_run_after', 'derivative_job', ['status', 'run_after'])
+    # Queue files uploaded before this revision
+    op.execute(sa.text("INSERT INTO derivative_job (created_at, updated_at, file_id, status, attempts, run_after) "
+        "SELECT CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, id, 0, 0, CURRENT_TIMESTAMP FROM stored_file"))
+
+
+def downgrade():
+    op.drop_index('ix_derivative_job_status_run_after', 'derivative_job')
+    op.drop_table('derivative_job')
+    op.drop_column('stored_file', 'preview')
+    op.drop_column('stored_file', 'thumbnail')
@@ -0,0 +1,43 @@
+"""Settlement balances
+
+Revision ID: 7a4c2e9f5b16
+Revises: 6e1f9b2d4a58
+Create Date: 2026-10-18 16:20:57.663190
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7a4c2e9f5b16'
+down_revision = '6e1f9b2d4a58'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('balance',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('workspace_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('currency', sa.Unicode(length=3), nullable=False),
+    sa.Column('due', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('paid', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['workspace_id'], ['workspace.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('workspace_id', 'user_id', 'currency')
+    )
+    # Balances from accepted (3) and closed (6) reports and payments so far
+    op.execute(sa.text("INSERT INTO balance (created_at, updated_at, workspace_id, user_id, currency, due, paid) "
+        "SELECT CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, workspace_id, user_id, currency, SUM(due), SUM(paid) FROM ("
+        "SELECT workspace_id, user_id, currency, total_value AS due, 0 AS paid FROM expense_report "
+        "WHERE status IN (3, 6) "
+        "UNION ALL "
+        "SELECT workspace_id, user_id, currency, 0 AS due, amount AS paid FROM payment"
+        ") AS entries GROUP BY workspace_id, user_id, currency"))
+
+
+def downgrade():
+    op.drop_table('balance')
@@ -0,0 +1,37 @@
+"""Notification outbox
+
+Revision ID: 8b5d3f0a6c27
+Revises: 7a4c2e9f5b16
+Create Date: 2026-10-18 17:04:12.318745
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8b5d3f0a6c27'
+down_revision = '7a4c2e9f5b16'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('notification_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('report_id', sa.Integer(), nullable=False),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('recipient_id', sa.Integer(), nullable=False),
+    sa.Column('event', sa.Unicode(length=40), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['actor_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['recipient_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['report_id'], ['expense_report.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notification_event_sent_at_recipient', 'notification_event', ['sent_at', 'recipient_id'])
+
+
+def downgrade():
+    op.drop_index('ix_notification_event_sent_at_recipient', 'notification_event')
+    op.drop_table('notification_event')
@@ -0,0 +1,22 @@
+"""User sync fingerprint
+
+Revision ID: 9c6e4a1b7d38
+Revises: 8b5d3f0a6c27
+Create Date: 2026-10-18 18:12:40.561203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9c6e4a1b7d38'
+down_revision = '8b5d3f0a6c27'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('user', sa.Column('sync_fingerprint', sa.Unicode(length=40), nullable=True))
+
+
+def downgrade():
+    op.drop_column('user', 'sync_fingerprint')
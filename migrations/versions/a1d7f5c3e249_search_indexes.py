@@ -0,0 +1,59 @@
+"""Search indexes
+
+Revision ID: a1d7f5c3e249
+Revises: 9c6e4a1b7d38
+Create Date: 2026-10-18 20:41:08.294417
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a1d7f5c3e249'
+down_revision = '9c6e4a1b7d38'
+
+import logging
+from alembic import op
+
+logger = logging.getLogger('alembic.env')
+
+SEARCH_COLUMNS = (
+    ('expense_report', ('title', 'description')),
+    ('expense', ('description',)),
+    )
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        logger.info("Search is not available on %s, not making search indexes", dialect)
+        return
+    for table, columns in SEARCH_COLUMNS:
+        if dialect == 'postgresql':
+            op.execute("CREATE INDEX ix_%s_search ON %s USING gin (to_tsvector('english', %s))" % (
+                table, table, " || ' ' || ".join(columns)))
+        elif dialect == 'sqlite':
+            fts = table + '_search'
+            names = ', '.join(columns)
+            insert = 'INSERT INTO %s (rowid, %s) VALUES (new.id, %s);' % (
+                fts, names, ', '.join('new.' + column for column in columns))
+            delete = "INSERT INTO %s (%s, rowid, %s) VALUES ('delete', old.id, %s);" % (
+                fts, fts, names, ', '.join('old.' + column for column in columns))
+            op.execute("CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='id', "
+                "tokenize='porter unicode61')" % (fts, names, table))
+            op.execute('CREATE TRIGGER %s_insert AFTER INSERT ON %s BEGIN %s END' % (fts, table, insert))
+            op.execute('CREATE TRIGGER %s_delete AFTER DELETE ON %s BEGIN %s END' % (fts, table, delete))
+            op.execute('CREATE TRIGGER %s_update AFTER UPDATE OF %s ON %s BEGIN %s %s END' % (
+                fts, names, table, delete, insert))
+            op.execute("INSERT INTO %s (%s) VALUES ('rebuild')" % (fts, fts))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        return
+    for table, columns in SEARCH_COLUMNS:
+        if dialect == 'postgresql':
+            op.drop_index('ix_%s_search' % table, table)
+        elif dialect == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute('DROP TRIGGER %s_search_%s' % (table, trigger))
+            op.execute('DROP TABLE %s_search' % table)
@@ -0,0 +1,36 @@
+"""Report transition history
+
+Revision ID: b2e8a6d4f35a
+Revises: a1d7f5c3e249
+Create Date: 2026-10-18 21:16:53.702918
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b2e8a6d4f35a'
+down_revision = 'a1d7f5c3e249'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('report_transition',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('report_id', sa.Integer(), nullable=False),
+    sa.Column('from_status', sa.SmallInteger(), nullable=True),
+    sa.Column('to_status', sa.SmallInteger(), nullable=False),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('datetime', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['actor_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['report_id'], ['expense_report.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_report_transition_datetime', 'report_transition', ['datetime'], postgresql_using='brin')
+    op.create_index('ix_report_transition_report_datetime', 'report_transition', ['report_id', 'datetime'])
+
+
+def downgrade():
+    op.drop_index('ix_report_transition_report_datetime', 'report_transition')
+    op.drop_index('ix_report_transition_datetime', 'report_transition')
+    op.drop_table('report_transition')
@@ -0,0 +1,29 @@
+"""Nullable converted totals
+
+Revision ID: c3f9b7e5a461
+Revises: b2e8a6d4f35a
+Create Date: 2026-10-18 23:05:17.418263
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c3f9b7e5a461'
+down_revision = 'b2e8a6d4f35a'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # Reports without exchange rates keep their stale totals until
+    # ``python manage.py convertreports`` sets them to NULL
+    op.alter_column('expense_report', 'total_converted',
+               existing_type=sa.Numeric(precision=10, scale=2),
+               nullable=True)
+
+
+def downgrade():
+    op.execute(sa.text('UPDATE expense_report SET total_converted = 0 WHERE total_converted IS NULL'))
+    op.alter_column('expense_report', 'total_converted',
+               existing_type=sa.Numeric(precision=10, scale=2),
+               nullable=False)
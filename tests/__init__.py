@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests run against an in-memory SQLite database, made afresh for each test.
+"""
+
+import os
+import unittest
+
+os.environ.setdefault('ENVIRONMENT', 'testing')
+
+from coaster.utils import buid
+
+from kharcha import app
+from kharcha.models import db, User, Workspace, Budget, Category
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = app.test_request_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def make_workspace(self, name=u'test'):
+        """
+        Make a workspace with a user, two budgets and a category.
+        """
+        self.user = User(userid=buid(), username=u'user', fullname=u"User", email=u'user@example.com')
+        self.workspace = Workspace(name=name, title=u"Test", userid=buid(), currency=u'INR',
+            timezone=u'Asia/Kolkata')
+        self.budgets = [Budget(workspace=self.workspace, name=u'budget%d' % number, title=u"Budget %d" % number)
+            for number in (1, 2)]
+        self.category = Category(workspace=self.workspace, name=u'travel', title=u"Travel")
+        db.session.add_all([self.user, self.workspace, self.category] + self.budgets)
+        db.session.commit()
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import io
+from decimal import Decimal
+from datetime import datetime
+
+from kharcha.models import db, ExpenseReport, load_exchange_rates
+from tests import DatabaseTestCase
+
+
+class TestConversion(DatabaseTestCase):
+    def setUp(self):
+        super(TestConversion, self).setUp()
+        self.make_workspace()
+
+    def test_unknown_rate(self):
+        report = ExpenseReport(workspace=self.workspace, user=self.user, title=u"Trip", currency=u'EUR',
+            datetime=datetime(2020, 1, 15), total_value=Decimal('10.00'))
+        report.make_name()
+        report.update_converted()
+        db.session.add(report)
+        db.session.commit()
+        self.assertIsNone(report.total_converted)
+
+        load_exchange_rates(io.StringIO(u'date,currency,rate\n2020-01-01,EUR,0.9\n2020-01-01,INR,72\n'))
+        for done in ExpenseReport.convert_totals():
+            db.session.commit()
+        db.session.refresh(report)
+        self.assertEqual(report.total_converted, Decimal('800.00'))
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from decimal import Decimal
+
+from kharcha.models import db, User, Workspace, ExpenseReport, Expense, SpendRollup
+from benchmarks.datagen import generate
+from tests import DatabaseTestCase
+
+
+class TestDatagen(DatabaseTestCase):
+    def test_generate(self):
+        generate(workspaces=2, users=5, budgets=2, reports=20, expenses=2, days=60)
+        self.assertEqual(Workspace.query.count(), 2)
+        self.assertEqual(ExpenseReport.query.count(), 40)
+        # Rollups account for every expense
+        self.assertEqual(db.session.query(db.func.sum(SpendRollup.count)).scalar(), Expense.query.count())
+        self.assertEqual(Decimal(db.session.query(db.func.sum(SpendRollup.amount)).scalar()),
+            Decimal(db.session.query(db.func.sum(Expense.amount)).scalar()))
+
+    def test_same_data(self):
+        sizes = dict(workspaces=1, users=5, budgets=1, reports=5, expenses=1, days=30)
+        generate(**sizes)
+        made = sorted(user.userid for user in User.query)
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        generate(**sizes)
+        self.assertEqual(sorted(user.userid for user in User.query), made)
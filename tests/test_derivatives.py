@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+
+from kharcha import app
+from kharcha.models import db, JOB_STATUS, StoredFile, DerivativeJob
+from kharcha.derivatives import claim_jobs
+from tests import DatabaseTestCase
+
+
+class TestClaimJobs(DatabaseTestCase):
+    def setUp(self):
+        super(TestClaimJobs, self).setUp()
+        self.job = DerivativeJob(file=StoredFile(hash=u'0' * 64, size=1, mimetype=u'application/pdf'),
+            status=JOB_STATUS.RUNNING, claimed_at=datetime.utcnow() - timedelta(days=1))
+        db.session.add(self.job)
+        db.session.commit()
+
+    def test_stale_job_is_retried_later(self):
+        self.assertEqual(claim_jobs(10), [])
+        job = DerivativeJob.query.get(self.job.id)
+        self.assertEqual(job.status, JOB_STATUS.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.run_after > datetime.utcnow())
+
+    def test_stale_job_fails_after_last_attempt(self):
+        self.job.attempts = app.config.get('JOB_ATTEMPTS', 5) - 1
+        db.session.commit()
+        claim_jobs(10)
+        job = DerivativeJob.query.get(self.job.id)
+        self.assertEqual(job.status, JOB_STATUS.FAILED)
+        self.assertTrue(job.error)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+from flask import g
+
+from kharcha.models import db, REPORT_STATUS, User, ExpenseReport, ReportTransition
+from tests import DatabaseTestCase
+
+
+class TestReportTransition(DatabaseTestCase):
+    def setUp(self):
+        super(TestReportTransition, self).setUp()
+        self.make_workspace()
+        self.reviewer = User(userid=u'reviewer', username=u'reviewer', fullname=u"Reviewer",
+            email=u'reviewer@example.com')
+        db.session.add(self.reviewer)
+        db.session.commit()
+        g.user = self.user
+
+    def add_report(self, status=REPORT_STATUS.DRAFT):
+        report = ExpenseReport(workspace=self.workspace, user=self.user, title=u"Report", status=status)
+        report.make_name()
+        db.session.add(report)
+        db.session.commit()
+        return report
+
+    def transitions(self, report):
+        return [(t.from_status, t.to_status, t.actor_id) for t in
+            ReportTransition.query.filter_by(report_id=report.id).order_by(ReportTransition.id)]
+
+    def test_created(self):
+        report = self.add_report()
+        self.assertEqual(self.transitions(report), [(None, REPORT_STATUS.DRAFT, self.user.id)])
+
+    def test_expired_report(self):
+        report = self.add_report(REPORT_STATUS.PENDING)
+        # The commit expired the report, so its old status isn't loaded
+        self.assertNotIn('status', report.__dict__)
+        g.user = self.reviewer
+        report.status = REPORT_STATUS.ACCEPTED
+        db.session.commit()
+        self.assertEqual(self.transitions(report), [
+            (None, REPORT_STATUS.PENDING, self.user.id),
+            (REPORT_STATUS.PENDING, REPORT_STATUS.ACCEPTED, self.reviewer.id)])
+
+    def test_unchanged_status(self):
+        report = self.add_report(REPORT_STATUS.PENDING)
+        report.status = REPORT_STATUS.PENDING
+        report.title = u"Renamed"
+        db.session.commit()
+        self.assertEqual(len(self.transitions(report)), 1)
+
+    def test_time_in_pending(self):
+        start = datetime.utcnow() - timedelta(days=1)
+        for hours, outcome, actor in (
+                (1, REPORT_STATUS.ACCEPTED, self.reviewer),
+                (3, REPORT_STATUS.REJECTED, self.reviewer),
+                (5, REPORT_STATUS.WITHDRAWN, self.user)):
+            report = self.add_report(REPORT_STATUS.PENDING)
+            g.user = actor
+            report.status = outcome
+            db.session.commit()
+            g.user = self.user
+            entered, left = ReportTransition.query.filter_by(report_id=report.id).order_by(
+                ReportTransition.id).all()
+            entered.datetime = start
+            left.datetime = start + timedelta(hours=hours)
+        db.session.commit()
+
+        # Only stays ended by a reviewer count; the withdrawn report doesn't
+        rows = ReportTransition.time_in_status(REPORT_STATUS.PENDING, workspace_id=self.workspace.id).all()
+        self.assertEqual(len(rows), 1)
+        left_by, count, average, longest = rows[0]
+        self.assertEqual((left_by, count), (self.reviewer.id, 2))
+        self.assertAlmostEqual(average, 2 * 3600, delta=1)
+        self.assertAlmostEqual(longest, 3 * 3600, delta=1)
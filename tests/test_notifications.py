@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import smtplib
+from email import message_from_string
+from flask import g
+
+import kharcha.notifications
+from kharcha.models import db, User, ExpenseReport, NotificationEvent
+from kharcha.notifications import dispatch
+from tests import DatabaseTestCase
+
+
+class StandInSMTP(object):
+    """
+    SMTP connection that keeps messages instead of sending them, or fails.
+    """
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.messages = []
+        self.closed = False
+
+    def sendmail(self, sender, recipients, message):
+        if self.fail:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.messages.append((recipients, message_from_string(message)))
+
+    def quit(self):
+        if self.fail:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+class TestDispatch(DatabaseTestCase):
+    def setUp(self):
+        super(TestDispatch, self).setUp()
+        self.make_workspace()
+        self.reviewer = User(userid=u'reviewer', username=u'reviewer', fullname=u"Reviewer",
+            email=u'reviewer@example.com')
+        self.other = User(userid=u'other', username=u'other', fullname=u"Other", email=u'other@example.com')
+        db.session.add_all([self.reviewer, self.other])
+        self.reports = []
+        for title in (u"Trip", u"Supplies"):
+            report = ExpenseReport(workspace=self.workspace, user=self.user, title=title)
+            report.make_name()
+            db.session.add(report)
+            self.reports.append(report)
+        db.session.commit()
+
+        g.user = self.reviewer
+        trip, supplies = self.reports
+        trip.workflow().notify(u'return_for_review', [self.user, self.reviewer])
+        trip.workflow().notify(u'accept', [self.user, self.reviewer])
+        supplies.workflow().notify(u'reject', [self.user, self.other])
+        db.session.commit()
+
+        self.smtp = StandInSMTP()
+        self.smtp_connection = kharcha.notifications.smtp_connection
+        kharcha.notifications.smtp_connection = lambda: self.smtp
+
+    def tearDown(self):
+        kharcha.notifications.smtp_connection = self.smtp_connection
+        super(TestDispatch, self).tearDown()
+
+    def body(self, message):
+        return message.get_payload(decode=True).decode('utf-8')
+
+    def test_actor_excluded(self):
+        self.assertEqual(NotificationEvent.query.filter_by(recipient=self.reviewer).count(), 0)
+
+    def test_one_digest_per_recipient(self):
+        self.assertEqual(dispatch(), 4)
+        recipients = sorted(recipients[0] for recipients, message in self.smtp.messages)
+        self.assertEqual(recipients, [u'other@example.com', u'user@example.com'])
+        self.assertTrue(self.smtp.closed)
+        self.assertEqual(NotificationEvent.query.filter(NotificationEvent.sent_at == None).count(), 0)  # NOQA
+
+    def test_latest_event_per_report(self):
+        dispatch()
+        body = [self.body(message) for recipients, message in self.smtp.messages
+            if recipients == [u'user@example.com']][0]
+        self.assertIn(u"accepted your report “Trip”", body)
+        self.assertNotIn(u"returned", body)
+        self.assertIn(u"rejected your report “Supplies”", body)
+
+    def test_failure_leaves_events_unsent(self):
+        self.smtp.fail = True
+        self.assertEqual(dispatch(), 0)
+        self.assertTrue(self.smtp.closed)
+        self.assertEqual(NotificationEvent.query.filter(NotificationEvent.sent_at == None).count(), 4)  # NOQA
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from coaster.utils import buid
+
+from kharcha.models import db, REPORT_STATUS, User, Team, ExpenseReport
+from kharcha.views.expenses import available_reports
+from tests import DatabaseTestCase
+
+STATUSES = [REPORT_STATUS.DRAFT, REPORT_STATUS.PENDING, REPORT_STATUS.REVIEW, REPORT_STATUS.ACCEPTED,
+    REPORT_STATUS.REJECTED, REPORT_STATUS.WITHDRAWN, REPORT_STATUS.CLOSED]
+
+
+class TestVisibleReports(DatabaseTestCase):
+    def make_user(self, name, owned=()):
+        user = User(userid=buid(), username=name, fullname=name.title(), email=u'%s@example.com' % name)
+        # Organization ownership comes from Lastuser
+        user.organizations_owned_ids = lambda: list(owned)
+        db.session.add(user)
+        return user
+
+    def setUp(self):
+        super(TestVisibleReports, self).setUp()
+        self.make_workspace()
+        workspace = self.workspace
+        self.users = {
+            'owner': self.user,
+            'admin': self.make_user(u'admin'),
+            'reviewer': self.user_in_team(u'reviewer', workspace.review_teams),
+            'member': self.make_user(u'member'),
+            'orgowner': self.make_user(u'orgowner', owned=[workspace.userid]),
+            'outsider': self.make_user(u'outsider'),
+            }
+        self.user.organizations_owned_ids = lambda: []
+        self.add_team(workspace.admin_teams, self.users['admin'])
+        self.add_team(workspace.access_teams, self.users['member'], self.user)
+        for user in (self.user, self.users['member']):
+            for status in STATUSES:
+                report = ExpenseReport(workspace=workspace, user=user, title=u"Report", status=status)
+                report.make_name()
+                db.session.add(report)
+        db.session.commit()
+
+    def add_team(self, teams, *users):
+        team = Team(userid=buid(), orgid=self.workspace.userid, title=u"Team")
+        team.users = list(users)
+        teams.append(team)
+
+    def user_in_team(self, name, teams):
+        user = self.make_user(name)
+        self.add_team(teams, user)
+        return user
+
+    def test_same_as_permissions(self):
+        workspace = self.workspace
+        reports = ExpenseReport.query.filter_by(workspace=workspace).all()
+        for role, user in self.users.items():
+            expected = set(report.id for report in reports
+                if 'view' in report.permissions(user, workspace.permissions(user)))
+            visible = set(report.id for report in available_reports(workspace, user, all=True))
+            self.assertEqual(visible, expected, role)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from decimal import Decimal
+from datetime import date
+from sqlalchemy.exc import IntegrityError
+
+from kharcha.models import db, REPORT_STATUS, ExpenseReport, Expense, SpendRollup
+from tests import DatabaseTestCase
+
+
+class TestSpendRollup(DatabaseTestCase):
+    def setUp(self):
+        super(TestSpendRollup, self).setUp()
+        self.make_workspace()
+
+    def add_report(self, budget, amounts):
+        report = ExpenseReport(workspace=self.workspace, user=self.user, title=u"Report", budget=budget,
+            currency=u'INR', status=REPORT_STATUS.PENDING)
+        report.make_name()
+        for seq, amount in enumerate(amounts, 1):
+            report.expenses.append(Expense(seq=seq, date=date(2020, 1, 15), category=self.category,
+                description=u"Taxi", amount=Decimal(amount)))
+        db.session.add(report)
+        db.session.commit()
+        return report
+
+    def rollups(self):
+        return dict((r.budget_id, (r.amount, r.count)) for r in SpendRollup.query.filter_by(
+            category=self.category, month=date(2020, 1, 1), status=REPORT_STATUS.PENDING, currency=u'INR'))
+
+    def test_budgets_with_same_key(self):
+        # Same category, month, status and currency in two budgets and none
+        first, second = self.budgets
+        self.add_report(first, ['100.00'])
+        self.add_report(second, ['20.00', '30.00'])
+        self.add_report(None, ['5.00'])
+        self.add_report(None, ['7.00'])
+        expected = {
+            first.id: (Decimal('100.00'), 1),
+            second.id: (Decimal('50.00'), 2),
+            None: (Decimal('12.00'), 2),
+            }
+        self.assertEqual(self.rollups(), expected)
+
+        SpendRollup.rebuild()
+        db.session.commit()
+        self.assertEqual(self.rollups(), expected)
+
+    def test_unbudgeted_key_is_unique(self):
+        # What a concurrent transaction would insert after this one found no
+        # row for the key: it must fail, so that increment() updates instead
+        self.add_report(None, ['5.00'])
+        with self.assertRaises(IntegrityError):
+            db.session.execute(SpendRollup.__table__.insert().values(workspace_id=self.workspace.id,
+                budget_id=None, category_id=self.category.id, month=date(2020, 1, 1),
+                status=REPORT_STATUS.PENDING, currency=u'INR', amount=Decimal('1.00'), count=1))
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from kharcha.models import db, ExpenseReport, search_hits
+from tests import DatabaseTestCase
+
+
+class TestSearch(DatabaseTestCase):
+    def test_create_all_again(self):
+        self.make_workspace()
+        report = ExpenseReport(workspace=self.workspace, user=self.user, title=u"Trip to Bangalore")
+        report.make_name()
+        db.session.add(report)
+        db.session.commit()
+        db.create_all()
+        hits = db.session.execute(search_hits(u'bangalore', self.workspace.id)).fetchall()
+        self.assertEqual([hit.report_id for hit in hits], [report.id])
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+from kharcha.models import db, Workspace
+from kharcha.views.index import sidebar_version
+from tests import DatabaseTestCase
+
+
+class OrganizationMember(object):
+    """
+    User as far as :meth:`Workspace.sync_organizations` is concerned.
+    """
+    def __init__(self, organizations):
+        self.organizations = organizations
+
+    def organizations_memberof(self):
+        return self.organizations
+
+
+class TestWorkspaceSync(DatabaseTestCase):
+    def test_sync_invalidates_sidebar(self):
+        self.make_workspace()
+        scopes = ['workspaces', 'workspace/%d' % self.workspace.id]
+        versions = [sidebar_version(scope) for scope in scopes]
+        self.assertEqual([sidebar_version(scope) for scope in scopes], versions)
+
+        Workspace.sync_organizations(OrganizationMember([
+            {'userid': self.workspace.userid, 'name': u'renamed', 'title': u"Renamed"}]))
+        db.session.commit()
+        self.assertEqual(Workspace.query.get(self.workspace.id).title, u"Renamed")
+        for scope, version in zip(scopes, versions):
+            self.assertNotEqual(sidebar_version(scope), version)
+
+    def test_unchanged_sync(self):
+        self.make_workspace()
+        versions = [sidebar_version('workspaces'), sidebar_version('workspace/%d' % self.workspace.id)]
+        Workspace.sync_organizations(OrganizationMember([
+            {'userid': self.workspace.userid, 'name': self.workspace.name, 'title': self.workspace.title}]))
+        db.session.commit()
+        self.assertEqual([sidebar_version('workspaces'), sidebar_version('workspace/%d' % self.workspace.id)],
+            versions)